@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+# Ventanas de actividad soportadas, en segundos
+ACTIVITY_WINDOWS = {
+    "24h": 86400,
+    "7d": 7 * 86400,
+    "30d": 30 * 86400
+}
+
+
+class ActivityWindow:
+    """Cuenta usuarios activos en ventanas deslizantes (24h, 7d, 30d).
+
+    Los usuarios se agrupan en cubetas de `bucket_seconds` según su última
+    actividad. Cada ventana guarda su recuento y la cubeta más antigua que
+    incluye; al avanzar el tiempo solo se restan las cubetas que salen, así que
+    registrar actividad y consultar un recuento cuesta O(1) amortizado.
+    Los usuarios sin actividad en la ventana más larga se eliminan del mapa.
+    """
+
+    def __init__(self, last_active, windows=ACTIVITY_WINDOWS, bucket_seconds=60, on_evict=None):
+        self.last_active = last_active  # {user_id: timestamp}, se modifica en el sitio
+        self.bucket_seconds = bucket_seconds
+        self.on_evict = on_evict
+        self._sizes = {name: max(1, seconds // bucket_seconds) for name, seconds in windows.items()}
+        # Las ventanas se recorren de menor a mayor: la más larga es la que expulsa usuarios
+        self._order = sorted(self._sizes, key=self._sizes.get)
+        self._retention = self._order[-1]
+        self._buckets = {}  # {cubeta: set(user_ids)}
+        self._user_bucket = {}  # {user_id: cubeta}
+        self._now = self._bucket(time.time())
+        self._start = {name: self._now - size + 1 for name, size in self._sizes.items()}
+        self._counts = dict.fromkeys(self._sizes, 0)
+
+        for user_id, timestamp in list(last_active.items()):
+            bucket = self._bucket(timestamp)
+            if bucket < self._start[self._retention]:
+                self._evict(user_id)
+            else:
+                self._insert(user_id, bucket)
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def _insert(self, user_id, bucket):
+        self._buckets.setdefault(bucket, set()).add(user_id)
+        self._user_bucket[user_id] = bucket
+        for name, start in self._start.items():
+            if bucket >= start:
+                self._counts[name] += 1
+
+    def _evict(self, user_id):
+        del self.last_active[user_id]
+        if self.on_evict:
+            self.on_evict(user_id)
+
+    def _advance(self, now):
+        """Mueve el inicio de cada ventana hasta la cubeta actual."""
+        if now <= self._now:
+            return
+        self._now = now
+        for name in self._order:
+            start, new_start = self._start[name], now - self._sizes[name] + 1
+            if new_start - start > len(self._buckets):
+                # Tras un salto largo es más barato recorrer solo las cubetas existentes
+                expired = [bucket for bucket in self._buckets if start <= bucket < new_start]
+            else:
+                expired = [bucket for bucket in range(start, new_start) if bucket in self._buckets]
+            for bucket in expired:
+                self._counts[name] -= len(self._buckets[bucket])
+                if name == self._retention:
+                    for user_id in self._buckets.pop(bucket):
+                        del self._user_bucket[user_id]
+                        self._evict(user_id)
+            self._start[name] = new_start
+
+    def touch(self, user_id, timestamp=None):
+        """Registra actividad de un usuario."""
+        timestamp = time.time() if timestamp is None else timestamp
+        bucket = self._bucket(timestamp)
+        self._advance(bucket)
+        self.last_active[user_id] = timestamp
+
+        previous = self._user_bucket.get(user_id)
+        if previous == bucket:
+            return
+        if previous is not None:
+            users = self._buckets[previous]
+            users.discard(user_id)
+            if not users:
+                del self._buckets[previous]
+            for name, start in self._start.items():
+                if previous >= start:
+                    self._counts[name] -= 1
+        self._insert(user_id, bucket)
+
+    def count(self, window="24h", now=None):
+        """Devuelve el número de usuarios activos en la ventana indicada."""
+        self._advance(self._bucket(time.time() if now is None else now))
+        return self._counts[window]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+ALBUM_DELAY = 1.0  # Segundos sin partes nuevas antes de dar un álbum por completo
+ALBUM_MAX_ITEMS = 10  # Máximo de elementos que admite send_media_group
+
+
+def to_input_media(message):
+    """Convierte una parte de un álbum en el InputMedia equivalente, o None si no se puede."""
+    caption = {"caption": message.caption, "caption_entities": message.caption_entities}
+    if message.photo:
+        return InputMediaPhoto(message.photo[-1].file_id, has_spoiler=message.has_media_spoiler, **caption)
+    if message.video:
+        return InputMediaVideo(message.video.file_id, has_spoiler=message.has_media_spoiler, **caption)
+    if message.document:
+        return InputMediaDocument(message.document.file_id, **caption)
+    if message.audio:
+        return InputMediaAudio(message.audio.file_id, **caption)
+    return None
+
+
+class AlbumBuffer:
+    """Agrupa las partes de un álbum (mismo media_group_id) que llegan como updates separados.
+
+    Cada parte reinicia un temporizador de `delay` segundos; cuando vence, o al
+    llegar a ALBUM_MAX_ITEMS partes, se llama a `flush(messages)` con todas las
+    partes en orden para reenviarlas en un único send_media_group.
+
+    Los envíos de un mismo chat se encadenan: un álbum no empieza a enviarse
+    hasta que termina el anterior, y drain() permite esperar a que salgan los
+    pendientes antes de reenviar un mensaje suelto, para conservar el orden.
+    """
+
+    def __init__(self, delay=ALBUM_DELAY):
+        self.delay = delay
+        self._albums = {}  # {(chat_id, media_group_id): [mensajes]}
+        self._timers = {}  # {(chat_id, media_group_id): TimerHandle}
+        self._flush = {}  # {(chat_id, media_group_id): corrutina flush}
+        self._sending = {}  # {chat_id: tarea del último álbum del chat en envío}
+
+    def __len__(self):
+        return len(self._albums)
+
+    def add(self, message, flush):
+        """Añade una parte del álbum. `flush` es una función async que recibe la lista de mensajes."""
+        key = (message.chat_id, message.media_group_id)
+        if key not in self._albums:
+            # Un álbum nuevo cierra los anteriores del mismo chat, que deben salir antes
+            for other in [other for other in self._albums if other[0] == message.chat_id]:
+                self._release(other)
+        messages = self._albums.setdefault(key, [])
+        messages.append(message)
+        self._flush[key] = flush
+
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if len(messages) >= ALBUM_MAX_ITEMS:
+            self._release(key)
+        else:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.delay, self._release, key)
+
+    def _release(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        messages = self._albums.pop(key)
+        flush = self._flush.pop(key)
+        messages.sort(key=lambda message: message.message_id)
+        chat_id = key[0]
+        previous = self._sending.get(chat_id)
+        task = asyncio.get_running_loop().create_task(self._run(previous, flush, messages))
+        self._sending[chat_id] = task
+        task.add_done_callback(lambda done: self._forget(chat_id, done))
+
+    def _forget(self, chat_id, task):
+        # Solo si no se ha encadenado otro álbum del chat detrás
+        if self._sending.get(chat_id) is task:
+            del self._sending[chat_id]
+
+    async def _run(self, previous, flush, messages):
+        if previous is not None:
+            # Esperar al álbum anterior del chat (sus errores ya se registran en su propia tarea)
+            await asyncio.wait([previous])
+        try:
+            await flush(messages)
+        except Exception as e:
+            logger.error(f"Error al reenviar el álbum {messages[0].media_group_id}: {e}")
+
+    async def drain(self, chat_id):
+        """Envía ya los álbumes pendientes del chat y espera a que terminen todos sus envíos."""
+        for key in [key for key in self._albums if key[0] == chat_id]:
+            self._release(key)
+        task = self._sending.get(chat_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def close(self):
+        """Reenvía de inmediato los álbumes pendientes (al apagar el bot)."""
+        for key in list(self._albums):
+            self._release(key)
+        if self._sending:
+            await asyncio.wait(list(self._sending.values()))
@@ -2,14 +2,26 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MenuButtonCommands, BotCommand
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.error import BadRequest
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
 import os
 import json
+import secrets
+import contextlib
+from collections import deque
 from dotenv import load_dotenv
 import time
 from datetime import datetime, timedelta
-from data_store import DataStore, format_time_difference, get_gender_emoji, get_gender_name
+from data_store import DataStore, CONTENT_TYPES, format_time_difference, get_gender_emoji, get_gender_name
+from storage import create_storage
+from outbound import fan_out, OutboundScheduler, PRIORITY_RELAY, PRIORITY_BACKGROUND
+from albums import AlbumBuffer, to_input_media
+from concurrency import KeyedLocks, OrderedUpdateProcessor
+from spam import SpamLimiter
+from stats import StatsService
+from ttlmap import TTLMap
 
 # Configuración de logging
 logging.basicConfig(
@@ -22,6 +34,28 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 SUPER_ADMIN_ID = int(os.getenv("SUPER_ADMIN_ID", "YOUR_TELEGRAM_ID"))  # Tu ID como superadmin
+SAVE_INTERVAL = float(os.getenv("SAVE_INTERVAL", "2"))  # Segundos entre escrituras a disco
+MATCH_INTERVAL = float(os.getenv("MATCH_INTERVAL", "0.5"))  # Segundos entre pasadas de emparejamiento
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # json | journal | sqlite
+GLOBAL_RATE = float(os.getenv("GLOBAL_RATE", "30"))  # Mensajes por segundo en total hacia Telegram
+CHAT_RATE = float(os.getenv("CHAT_RATE", "1"))  # Mensajes por segundo hacia un mismo chat
+ALBUM_DELAY = float(os.getenv("ALBUM_DELAY", "1"))  # Segundos de espera para reunir las partes de un álbum
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL pública base, p. ej. https://mibot.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "webhook")  # Ruta en la que escucha el servidor
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Se comprueba en la cabecera X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")  # Interfaz del servidor HTTP
+PORT = int(os.getenv("PORT", "8443"))  # Puerto del servidor HTTP (Railway lo define)
+SPAM_RATE = float(os.getenv("SPAM_RATE", "15"))  # Mensajes por minuto permitidos por usuario en un chat
+SPAM_BURST = float(os.getenv("SPAM_BURST", "15"))  # Mensajes seguidos permitidos antes de limitar
+SPAM_COOLDOWN = float(os.getenv("SPAM_COOLDOWN", "20"))  # Segundos de bloqueo al superar el límite
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))  # Updates procesados en paralelo (en orden por usuario)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))  # Segundos que se reutiliza un mensaje de estadísticas
+
+# Atributos de Message que identifican cada tipo de contenido, en orden de prioridad
+RELAY_CONTENT_TYPES = tuple(content_type for content_type in CONTENT_TYPES if content_type != "other")
+# Tipos que las estadísticas agrupan como "Otros"
+OTHER_CONTENT_TYPES = ("venue", "location", "contact", "poll", "dice", "other")
 
 # Estados de conversación
 GENDER_SELECTION, WAITING_MATCH, IN_CHAT = range(3)
@@ -29,7 +63,37 @@ REPORT_REASON, REPORT_EVIDENCE = range(3, 5)
 ADMIN_ADD, ADMIN_REMOVE = range(5, 7)
 
 # Inicializar el almacén de datos
-db = DataStore(SUPER_ADMIN_ID)
+db = DataStore(SUPER_ADMIN_ID, storage=create_storage(STORAGE_BACKEND))
+
+# Estadísticas a partir de contadores mantenidos, con los mensajes generados en caché
+stats_service = StatsService(db, ttl=STATS_CACHE_TTL)
+
+# Álbumes en curso de reenvío
+album_buffer = AlbumBuffer(delay=ALBUM_DELAY)
+
+# Locks por usuario para las operaciones que afectan a los dos miembros de una pareja
+pair_locks = KeyedLocks()
+
+# Limitador de mensajes por usuario (solo en memoria)
+spam_limiter = SpamLimiter(rate=SPAM_RATE, burst=SPAM_BURST, cooldown=SPAM_COOLDOWN)
+
+# Aviso a los usuarios baneados: como mucho uno por intervalo, para que insistir no nos cueste envíos
+BAN_NOTICE_INTERVAL = 60
+BANNED_MESSAGE = "Lo sentimos, tu acceso a este bot ha sido restringido."
+ban_notices = TTLMap(ttl=BAN_NOTICE_INTERVAL)  # {user_id: True}
+
+# Segundos que un administrador tiene para enviar el ID que se le ha pedido
+PENDING_INPUT_TTL = 300
+
+class PendingInputFilter(filters.MessageFilter):
+    """Deja pasar los mensajes de administradores a los que se les ha pedido un ID."""
+    
+    def __init__(self, admin_commands):
+        super().__init__()
+        self.admin_commands = admin_commands
+    
+    def filter(self, message):
+        return message.from_user is not None and self.admin_commands.has_pending_input(message.from_user.id)
 
 # Clase Admin Commands integrada desde admin_commands.py
 class AdminCommands:
@@ -39,6 +103,9 @@ class AdminCommands:
         self.data_store = data_store
         # Store super admin ID for easier access
         self.super_admin_id = SUPER_ADMIN_ID
+        # Administradores a los que se les ha pedido un ID: {user_id: (acción, hora de expiración)}
+        self.pending_inputs = {}
+        self.pending_input_filter = PendingInputFilter(self)
 
     def register_handlers(self, dispatcher):
         """Registra todos los manejadores relacionados con comandos administrativos."""
@@ -53,6 +120,46 @@ class AdminCommands:
         # Asegurarse de que este CallbackQueryHandler se ejecute antes del general
         # Manejar todos los callbacks que empiezan por admin_ y relacionados con administración
         dispatcher.add_handler(CallbackQueryHandler(self.admin_callback, pattern='^admin_'))
+        
+        # Respuestas a las peticiones de ID: un único manejador fijo para todos los administradores
+        dispatcher.add_handler(
+            MessageHandler(filters.TEXT & ~filters.COMMAND & self.pending_input_filter, self.handle_pending_input)
+        )
+    
+    def expect_user_id(self, user_id, action):
+        """Hace que el próximo texto del administrador se trate como un ID para `action`.
+        
+        `action(update, context, target_id)` se ejecuta una sola vez; la petición
+        caduca a los PENDING_INPUT_TTL segundos.
+        """
+        self.pending_inputs[user_id] = (action, time.time() + PENDING_INPUT_TTL)
+    
+    def has_pending_input(self, user_id):
+        """Indica si el usuario tiene una petición de ID en curso, descartándola si caducó."""
+        pending = self.pending_inputs.get(user_id)
+        if pending is None:
+            return False
+        if pending[1] < time.time():
+            del self.pending_inputs[user_id]
+            return False
+        return True
+    
+    async def handle_pending_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Procesa el ID que un administrador envía tras pulsar una acción del panel."""
+        pending = self.pending_inputs.pop(update.effective_user.id, None)
+        if pending is None:
+            return
+        action, _ = pending
+        
+        text = update.message.text.strip()
+        if text.isdigit():
+            await action(update, context, int(text))
+        else:
+            keyboard = [[InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")]]
+            await update.message.reply_text(
+                "❌ ID inválido. Operación cancelada.",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
     
     async def admin_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Muestra el panel de administración."""
@@ -67,17 +174,7 @@ class AdminCommands:
                 await update.message.reply_text("Lo siento, solo los administradores pueden acceder a este comando.")
 
         # Obtener estadísticas para el panel admin
-        total_users = self.data_store.stats["total_users"]
-        active_chats = len(self.data_store.active_chats) // 2
-        pending_reports = sum(1 for r in self.data_store.reports if r.get("status") == "pending")
-        
-        admin_message = (
-            "👑 *Panel de Administrador*\n\n"
-            f"👤 Total de usuarios: {total_users}\n"
-            f"💬 Conversaciones activas: {active_chats}\n"
-            f"🚨 Reportes pendientes: {pending_reports}\n\n"
-            "Selecciona una opción:"
-        )
+        admin_message = stats_service.render("admin_panel", render_admin_panel)
 
         # Crear botones para el panel de administración
         keyboard = [
@@ -198,24 +295,11 @@ class AdminCommands:
         query = update.callback_query
         user_id = query.from_user.id
         
-        if report_id >= len(self.data_store.reports):
+        if self.data_store.set_report_status(report_id, action, user_id) is None:
             await query.edit_message_text("Este reporte ya no existe.")
             return
         
-        report = self.data_store.reports[report_id]
-        
-        if action == "resolved":
-            report["status"] = "resolved"
-            report["resolved_by"] = user_id
-            report["resolved_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            status_msg = "resuelto"
-        else:  # dismissed
-            report["status"] = "dismissed"
-            report["dismissed_by"] = user_id
-            report["dismissed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            status_msg = "descartado"
-        
-        self.data_store.save_data()
+        status_msg = "resuelto" if action == "resolved" else "descartado"
         
         keyboard = [[InlineKeyboardButton("🔙 Volver a Reportes", callback_data="admin_reports")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -228,39 +312,7 @@ class AdminCommands:
     async def show_admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Muestra estadísticas detalladas para los administradores."""
         query = update.callback_query
-        stats = self.data_store.stats
-        content_types = stats["content_types"]
-        gender_stats = stats["gender_stats"]
-        
-        stats_message = (
-            "📊 *Estadísticas Detalladas*\n\n"
-            f"👥 *Usuarios registrados:* {stats['total_users']}\n"
-            f"👤 *Usuarios activos (24h):* {stats['daily_active_users']}\n"
-            f"💬 *Chats totales:* {stats['total_chats']}\n"
-            f"📝 *Mensajes enviados:* {stats['messages_sent']}\n\n"
-            f"*Distribución por género:*\n"
-        )
-        
-        total_users = max(1, stats['total_users'])
-        for gender, count in gender_stats.items():
-            gender_name = get_gender_name(gender)
-            emoji = get_gender_emoji(gender)
-            percentage = int(count/total_users*100)
-            stats_message += f"{emoji} {gender_name}: {count} ({percentage}%)\n"
-        
-        stats_message += f"\n*Tipos de contenido:*\n"
-        stats_message += f"💬 Texto: {content_types['text']}\n"
-        stats_message += f"🖼️ Fotos: {content_types['photo']}\n"
-        stats_message += f"😎 Stickers: {content_types['sticker']}\n"
-        stats_message += f"🎤 Audio/Voz: {content_types['voice'] + content_types['audio']}\n"
-        stats_message += f"📹 Videos/GIFs: {content_types['video'] + content_types['animation']}\n"
-        stats_message += f"📄 Documentos: {content_types['document']}\n\n"
-        
-        reports = self.data_store.reports
-        stats_message += f"🚨 *Reportes:*\n"
-        stats_message += f"- Pendientes: {sum(1 for r in reports if r.get('status') == 'pending')}\n"
-        stats_message += f"- Resueltos: {sum(1 for r in reports if r.get('status') == 'resolved')}\n"
-        stats_message += f"- Descartados: {sum(1 for r in reports if r.get('status') == 'dismissed')}"
+        stats_message = stats_service.render("admin_stats", render_admin_stats)
         
         keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -270,17 +322,16 @@ class AdminCommands:
     async def show_reports(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Muestra los reportes pendientes."""
         query = update.callback_query
-        pending_reports = [r for r in self.data_store.reports if r.get("status") == "pending"]
+        pending = self.data_store.reports.next_pending()
         
-        if not pending_reports:
+        if pending is None:
             keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text("No hay reportes pendientes de revisión.", reply_markup=reply_markup)
             return ConversationHandler.END
         
         # Mostrar el primer reporte pendiente
-        report = pending_reports[0]
-        report_id = self.data_store.reports.index(report)
+        report_id, report = pending
         
         report_text = (
             f"🚨 *Reporte #{report_id}*\n\n"
@@ -367,23 +418,8 @@ class AdminCommands:
         
         # Intentar banear al usuario
         if self.data_store.ban_user(target_id):
-            # Si el usuario estaba en un chat, finalizarlo
-            if target_id in self.data_store.active_chats:
-                partner_id = self.data_store.active_chats[target_id]
-                self.data_store.end_chat(target_id)
-                
-                # Notificar a la pareja
-                keyboard = [
-                    [InlineKeyboardButton("🔍 Buscar Otra Pareja", callback_data="find_partner")],
-                    [InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await context.bot.send_message(
-                    chat_id=partner_id,
-                    text="❗ Tu pareja ha sido desconectada por un administrador.",
-                    reply_markup=reply_markup
-                )
+            # Si el usuario estaba en un chat, finalizarlo y notificar a la pareja
+            await end_banned_user_chat(context, target_id)
                 
             await update.message.reply_text(f"✅ Usuario #{target_id} ha sido baneado correctamente.")
         else:
@@ -421,7 +457,8 @@ class AdminCommands:
     async def show_user_reports(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id):
         """Muestra los reportes relacionados con un usuario específico."""
         query = update.callback_query
-        user_reports = [r for r in self.data_store.reports if r["reported_id"] == target_user_id]
+        reports = self.data_store.reports
+        user_reports = reports.by_reported(target_user_id)
         
         if not user_reports:
             keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
@@ -432,10 +469,11 @@ class AdminCommands:
         # Mostrar resumen de reportes
         reports_text = f"🚨 *Reportes del Usuario #{target_user_id}*\n\n"
         
-        for i, report in enumerate(user_reports):
+        for report_id in user_reports:
+            report = reports[report_id]
             status = report.get("status", "pending")
             status_emoji = "⏳" if status == "pending" else "✅" if status == "resolved" else "❌"
-            reports_text += f"{status_emoji} Reporte #{i}: {report['reason'][:30]}...\n"
+            reports_text += f"{status_emoji} Reporte #{report_id}: {report['reason'][:30]}...\n"
         
         keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -448,23 +486,8 @@ class AdminCommands:
         is_callback = update.callback_query is not None
         
         if self.data_store.ban_user(user_id_to_ban):
-            # Si el usuario estaba en un chat, finalizarlo
-            if user_id_to_ban in self.data_store.active_chats:
-                partner_id = self.data_store.active_chats[user_id_to_ban]
-                self.data_store.end_chat(user_id_to_ban)
-                
-                # Notificar a la pareja
-                keyboard = [
-                    [InlineKeyboardButton("🔍 Buscar Otra Pareja", callback_data="find_partner")],
-                    [InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await context.bot.send_message(
-                    chat_id=partner_id,
-                    text="❗ Tu pareja ha sido desconectada por un administrador.",
-                    reply_markup=reply_markup
-                )
+            # Si el usuario estaba en un chat, finalizarlo y notificar a la pareja
+            await end_banned_user_chat(context, user_id_to_ban)
             
             keyboard = [[InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -566,55 +589,7 @@ class AdminCommands:
             "Por favor, ingresa el ID del usuario que deseas buscar:",
             parse_mode='HTML'
         )
-        
-        # Store state to identify upcoming messages as user ID inputs
-        context.user_data['expecting_user_id'] = True
-        
-        # Add a message handler for this specific user
-        application = context.application
-        user_id = update.effective_user.id
-        
-        # Initialize temp_handlers dict if needed
-        if not hasattr(context.application, 'temp_handlers'):
-            context.application.temp_handlers = {}
-        
-        # Register a temporary handler for this specific user
-        async def user_id_input_handler(update_inner: Update, context_inner: ContextTypes.DEFAULT_TYPE):
-            if update_inner.effective_user.id != user_id:
-                return
-                
-            if 'expecting_user_id' not in context_inner.user_data:
-                return
-                
-            del context_inner.user_data['expecting_user_id']
-            
-            # Remove this temporary handler
-            if user_id in context_inner.application.temp_handlers:
-                handler_to_remove = context_inner.application.temp_handlers[user_id]
-                application.remove_handler(handler_to_remove)
-                del context_inner.application.temp_handlers[user_id]
-                    
-            # Process the user ID
-            text = update_inner.message.text.strip()
-            if text.isdigit():
-                target_id = int(text)
-                await self.show_user_info(update_inner, context_inner, target_id)
-            else:
-                keyboard = [[InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await update_inner.message.reply_text(
-                    "❌ Por favor, introduce un ID de usuario válido (número).",
-                    reply_markup=reply_markup
-                )
-        
-        # Create handler
-        handler = MessageHandler(filters.TEXT & ~filters.COMMAND, user_id_input_handler)
-        
-        # Store our handler for later removal
-        context.application.temp_handlers[user_id] = handler
-        
-        # Add the handler (using proper API method)
-        application.add_handler(handler, group=0)
+        self.expect_user_id(update.effective_user.id, self.show_user_info)
     
     async def show_user_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_id: int):
         """Muestra información detallada sobre un usuario específico."""
@@ -629,7 +604,7 @@ class AdminCommands:
             last_active = "Nunca" if not user_data.get("last_active") else datetime.fromtimestamp(
                 user_data["last_active"]).strftime("%Y-%m-%d %H:%M:%S")
                 
-            reports_count = sum(1 for r in self.data_store.reports if r["reported_id"] == target_id)
+            reports_count = len(self.data_store.reports.by_reported(target_id))
             
             is_admin = "✅ Sí" if self.data_store.is_admin(target_id) else "❌ No"
             is_super = "✅ Sí" if self.data_store.is_super_admin(target_id) else "❌ No"
@@ -682,34 +657,16 @@ class AdminCommands:
             "Introduce el ID del usuario:",
             parse_mode='HTML'
         )
-        application = context.application
-        invoker_id = query.from_user.id
-
-        if not hasattr(application, 'temp_handlers'):
-            application.temp_handlers = {}
-
-        async def user_id_input_handler(update_inner: Update, context_inner: ContextTypes.DEFAULT_TYPE):
-            if update_inner.effective_user.id != invoker_id:
-                return
-            handler_tmp = application.temp_handlers.pop(invoker_id, None)
-            if handler_tmp:
-                application.remove_handler(handler_tmp)
-            text = update_inner.message.text.strip()
-            if text.isdigit():
-                new_admin_id = int(text)
-                if new_admin_id == self.super_admin_id:
-                    await update_inner.message.reply_text("❌ El superadministrador ya tiene permisos.")
-                    return
-                if self.data_store.add_admin(new_admin_id):
-                    await update_inner.message.reply_text(f"✅ Usuario #{new_admin_id} ahora es administrador.")
-                else:
-                    await update_inner.message.reply_text(f"❌ El usuario #{new_admin_id} ya era administrador.")
-            else:
-                await update_inner.message.reply_text("❌ ID inválido. Operación cancelada.")
-
-        handler = MessageHandler(filters.TEXT & ~filters.COMMAND, user_id_input_handler)
-        application.temp_handlers[invoker_id] = handler
-        application.add_handler(handler, group=0)
+        self.expect_user_id(query.from_user.id, self.add_admin_by_id)
+
+    async def add_admin_by_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE, new_admin_id: int):
+        """Convierte en administrador al usuario indicado por ID."""
+        if new_admin_id == self.super_admin_id:
+            await update.message.reply_text("❌ El superadministrador ya tiene permisos.")
+        elif self.data_store.add_admin(new_admin_id):
+            await update.message.reply_text(f"✅ Usuario #{new_admin_id} ahora es administrador.")
+        else:
+            await update.message.reply_text(f"❌ El usuario #{new_admin_id} ya era administrador.")
 
     async def handle_remove_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Solicita el ID del administrador a retirar."""
@@ -719,34 +676,16 @@ class AdminCommands:
             "Introduce el ID del administrador a eliminar:",
             parse_mode='HTML'
         )
-        application = context.application
-        invoker_id = query.from_user.id
-
-        if not hasattr(application, 'temp_handlers'):
-            application.temp_handlers = {}
-
-        async def user_id_input_handler(update_inner: Update, context_inner: ContextTypes.DEFAULT_TYPE):
-            if update_inner.effective_user.id != invoker_id:
-                return
-            handler_tmp = application.temp_handlers.pop(invoker_id, None)
-            if handler_tmp:
-                application.remove_handler(handler_tmp)
-            text = update_inner.message.text.strip()
-            if text.isdigit():
-                remove_id = int(text)
-                if remove_id == self.super_admin_id:
-                    await update_inner.message.reply_text("❌ No puedes eliminar al superadministrador.")
-                    return
-                if self.data_store.remove_admin(remove_id):
-                    await update_inner.message.reply_text(f"✅ Usuario #{remove_id} dejó de ser administrador.")
-                else:
-                    await update_inner.message.reply_text("❌ Ese usuario no es administrador.")
-            else:
-                await update_inner.message.reply_text("❌ ID inválido. Operación cancelada.")
+        self.expect_user_id(query.from_user.id, self.remove_admin_by_id)
 
-        handler = MessageHandler(filters.TEXT & ~filters.COMMAND, user_id_input_handler)
-        application.temp_handlers[invoker_id] = handler
-        application.add_handler(handler, group=0)
+    async def remove_admin_by_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE, remove_id: int):
+        """Retira los permisos de administrador al usuario indicado por ID."""
+        if remove_id == self.super_admin_id:
+            await update.message.reply_text("❌ No puedes eliminar al superadministrador.")
+        elif self.data_store.remove_admin(remove_id):
+            await update.message.reply_text(f"✅ Usuario #{remove_id} dejó de ser administrador.")
+        else:
+            await update.message.reply_text("❌ Ese usuario no es administrador.")
 
     async def handle_ban_by_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Solicita ID del usuario a banear."""
@@ -756,28 +695,7 @@ class AdminCommands:
             "Introduce el ID del usuario que deseas banear:",
             parse_mode='HTML'
         )
-        application = context.application
-        invoker_id = query.from_user.id
-
-        if not hasattr(application, 'temp_handlers'):
-            application.temp_handlers = {}
-
-        async def user_id_input_handler(update_inner: Update, context_inner: ContextTypes.DEFAULT_TYPE):
-            if update_inner.effective_user.id != invoker_id:
-                return
-            handler_tmp = application.temp_handlers.pop(invoker_id, None)
-            if handler_tmp:
-                application.remove_handler(handler_tmp)
-            text = update_inner.message.text.strip()
-            if text.isdigit():
-                target_id = int(text)
-                await self.process_ban(update_inner, context_inner, target_id)
-            else:
-                await update_inner.message.reply_text("❌ ID inválido. Operación cancelada.")
-
-        handler = MessageHandler(filters.TEXT & ~filters.COMMAND, user_id_input_handler)
-        application.temp_handlers[invoker_id] = handler
-        application.add_handler(handler, group=0)
+        self.expect_user_id(query.from_user.id, self.process_ban)
 
     async def handle_unban_by_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Solicita ID del usuario a desbanear."""
@@ -787,28 +705,7 @@ class AdminCommands:
             "Introduce el ID del usuario que deseas desbanear:",
             parse_mode='HTML'
         )
-        application = context.application
-        invoker_id = query.from_user.id
-
-        if not hasattr(application, 'temp_handlers'):
-            application.temp_handlers = {}
-
-        async def user_id_input_handler(update_inner: Update, context_inner: ContextTypes.DEFAULT_TYPE):
-            if update_inner.effective_user.id != invoker_id:
-                return
-            handler_tmp = application.temp_handlers.pop(invoker_id, None)
-            if handler_tmp:
-                application.remove_handler(handler_tmp)
-            text = update_inner.message.text.strip()
-            if text.isdigit():
-                target_id = int(text)
-                await self.process_unban(update_inner, context_inner, target_id)
-            else:
-                await update_inner.message.reply_text("❌ ID inválido. Operación cancelada.")
-
-        handler = MessageHandler(filters.TEXT & ~filters.COMMAND, user_id_input_handler)
-        application.temp_handlers[invoker_id] = handler
-        application.add_handler(handler, group=0)
+        self.expect_user_id(query.from_user.id, self.process_unban)
 
     async def add_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Maneja /add_admin <user_id>."""
@@ -842,6 +739,23 @@ class AdminCommands:
         else:
             await update.message.reply_text("❌ No se pudo eliminar (tal vez no era admin).")
 
+async def notify_partner_disconnected(context: ContextTypes.DEFAULT_TYPE, partner_id):
+    """Avisa a la pareja de un usuario baneado de que el chat terminó."""
+    keyboard = [
+        [InlineKeyboardButton("🔍 Buscar Otra Pareja", callback_data="find_partner")],
+        [InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    async def send_notice(chat_id):
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="❗ Tu pareja ha sido desconectada por un administrador.",
+            reply_markup=reply_markup
+        )
+    
+    return await fan_out(send_notice, [partner_id])
+
 # Comandos y funciones del bot
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Inicia el bot y muestra el mensaje de bienvenida."""
@@ -852,11 +766,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Actualizar actividad del usuario
     db.update_user_activity(user_id)
     
-    # Verificar si el usuario está baneado
-    if user_id in db.users and db.users[user_id].get("banned", False):
-        await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido." ,)
-        return ConversationHandler.END
-    
     # Configurar menú de comandos
     await context.bot.set_my_commands([
         BotCommand("start", "Iniciar el bot"),
@@ -934,11 +843,6 @@ async def gender_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await try_delete_user_message(update)
     user_id = update.effective_user.id
     db.update_user_activity(user_id)
-    
-    # Verificar si el usuario está baneado
-    if user_id in db.users and db.users[user_id].get("banned", False):
-        await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido.")
-        return ConversationHandler.END
 
     # Preparar el mensaje y botones para selección de género
     keyboard = [
@@ -974,9 +878,6 @@ async def set_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         db.set_user_gender(user_id, "non_binary")
         await query.edit_message_text("Has seleccionado: No Binario")
     
-    # Guardar los datos actualizados
-    db.save_data()
-    
     return ConversationHandler.END
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -985,11 +886,6 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user_id = update.effective_user.id
     db.update_user_activity(user_id)
     
-    # Verificar si el usuario está baneado
-    if user_id in db.users and db.users[user_id].get("banned", False):
-        await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido.")
-        return
-    
     help_message = (
         "<b>Comandos disponibles:</b>\n"
         "/start - Iniciar el bot\n"
@@ -1044,11 +940,6 @@ async def find_partner_command(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id = update.effective_user.id
     db.update_user_activity(user_id)
     
-    # Verificar si el usuario está baneado
-    if user_id in db.users and db.users[user_id].get("banned", False):
-        await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido.")
-        return ConversationHandler.END
-    
     return await find_partner(update, context)
 
 async def find_partner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1068,14 +959,6 @@ async def find_partner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             message = update.message
         
         db.update_user_activity(user_id)
-        
-        # Verificar si el usuario está baneado
-        if user_id in db.users and db.users[user_id].get("banned", False):
-            if isinstance(update, Update) and update.callback_query:
-                await query.edit_message_text("Lo sentimos, tu acceso a este bot ha sido restringido.")
-            else:
-                await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido.")
-            return ConversationHandler.END
     
         # Obtener el género del usuario
         _user_gender = db.users[user_id]["gender"]
@@ -1117,6 +1000,48 @@ async def find_partner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             await delete_previous_and_send(context, user_id, "Ha ocurrido un error. Por favor, inténtalo nuevamente.")
         return ConversationHandler.END
 
+async def notify_new_chat(context: ContextTypes.DEFAULT_TYPE, user_id, partner_id) -> None:
+    """Avisa a ambos usuarios de que empieza una nueva conversación."""
+    keyboard = [[InlineKeyboardButton("❌ Finalizar Chat", callback_data="end_chat")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    user_gender = db.users[user_id]["gender"]
+    partner_gender = db.users[partner_id]["gender"]
+    
+    # Limpiar el chat de ambos usuarios y avisarles en paralelo. El lock de la pareja
+    # evita que estos avisos se crucen con los de un chat anterior que aún se está cerrando
+    async with pair_locks.locked(user_id, partner_id):
+        # Un end_chat o un baneo pudo cerrar el chat mientras se esperaba el lock
+        if db.active_chats.get(user_id) != partner_id:
+            return
+        await asyncio.gather(*(
+            delete_previous_and_send(
+                context,
+                recipient_id,
+                f"🎉 <b>¡Nueva conversación iniciada!</b>\n\n"
+                f"Has sido emparejado con un {get_gender_emoji(other_gender)} {get_gender_name(other_gender)}.\n\n"
+                f"Tu identidad es anónima. Puedes comenzar a chatear ahora.",
+                reply_markup=reply_markup,
+                parse_mode='HTML',
+                clear_all=True  # Esto borrará todos los mensajes anteriores
+            )
+            for recipient_id, other_gender in ((user_id, partner_gender), (partner_id, user_gender))
+        ))
+
+async def matchmaking_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Empareja en bloque a los usuarios compatibles que siguen esperando."""
+    pairs = db.match_waiting_users()
+    if not pairs:
+        return
+    
+    results = await asyncio.gather(
+        *(notify_new_chat(context, user_id, partner_id) for user_id, partner_id in pairs),
+        return_exceptions=True
+    )
+    for (user_id, partner_id), result in zip(pairs, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error al notificar el emparejamiento {user_id} - {partner_id}: {result}")
+
 async def match_by_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Empareja usuarios según preferencia de género."""
     query = update.callback_query
@@ -1129,87 +1054,25 @@ async def match_by_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if preferred_gender == 'non':
         preferred_gender = 'non_binary'
     
-    # Obtener el género del usuario
-    user_gender = db.users[user_id]["gender"]
+    # Un botón antiguo no debe emparejar a quien ya está en un chat
+    if user_id in db.active_chats:
+        await query.edit_message_text("Ya estás en una conversación. Usa /end para finalizarla antes de buscar otra.")
+        return IN_CHAT
     
-    # Crear la clave combinada para el emparejamiento específico
-    # Format: "seeking_gender" 
-    # Ejemplo: "seeking_male", "seeking_female" - indica a quién está buscando
-    waiting_key = f"seeking_{preferred_gender}"
-    
-    # Inicializar los diccionarios si no existen
-    if not hasattr(db, 'gender_waiting_users'):
-        db.gender_waiting_users = {}
-    
-    # Asegurarse de que todas las claves de espera existan
-    for gender in ["seeking_male", "seeking_female", "seeking_non_binary"]:
-        if gender not in db.gender_waiting_users:
-            db.gender_waiting_users[gender] = []
-    
-    # Primero, buscar si hay alguien buscando mi género
-    seeking_my_gender = f"seeking_{user_gender}"
-    matched_partner = None
-    
-    if seeking_my_gender in db.gender_waiting_users and db.gender_waiting_users[seeking_my_gender]:
-        # Buscar entre quienes esperan mi género
-        for idx, waiting_user_id in enumerate(db.gender_waiting_users[seeking_my_gender]):
-            waiting_user_gender = db.users[waiting_user_id]["gender"]
-            # Si su género coincide con el que yo busco, emparejarnos
-            if waiting_user_gender == preferred_gender:
-                matched_partner = waiting_user_id
-                # Remover de la lista de espera
-                db.gender_waiting_users[seeking_my_gender].pop(idx)
-                break
+    # Buscar a alguien de mi género preferido que esté buscando mi género
+    matched_partner = db.find_waiting_partner(user_id, preferred_gender)
     
     # Si encontramos pareja
     if matched_partner:
+        # create_chat también saca a ambos de las listas de espera
         db.create_chat(user_id, matched_partner)
         
-        # Limpiar este usuario de todas las listas de espera
-        for key in db.gender_waiting_users:
-            if user_id in db.gender_waiting_users[key]:
-                db.gender_waiting_users[key].remove(user_id)
-        
-        # Enviar mensaje a ambos usuarios usando delete_previous_and_send para limpiar la conversación
-        keyboard = [[InlineKeyboardButton("❌ Finalizar Chat", callback_data="end_chat")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        partner_gender = db.users[matched_partner]["gender"]
-        
-        # Limpiar el chat para el usuario actual
-        await delete_previous_and_send(
-            context,
-            user_id,
-            f"🎉 <b>¡Nueva conversación iniciada!</b>\n\n"
-            f"Has sido emparejado con un {get_gender_emoji(partner_gender)} {get_gender_name(partner_gender)}.\n\n"
-            f"Tu identidad es anónima. Puedes comenzar a chatear ahora.",
-            reply_markup=reply_markup,
-            parse_mode='HTML',
-            clear_all=True  # Esto borrará todos los mensajes anteriores
-        )
-        
-        # Limpiar el chat para la pareja
-        await delete_previous_and_send(
-            context,
-            matched_partner,
-            f"🎉 <b>¡Nueva conversación iniciada!</b>\n\n"
-            f"Has sido emparejado con un {get_gender_emoji(user_gender)} {get_gender_name(user_gender)}.\n\n"
-            f"Tu identidad es anónima. Puedes comenzar a chatear ahora.",
-            reply_markup=reply_markup,
-            parse_mode='HTML',
-            clear_all=True  # Esto borrará todos los mensajes anteriores
-        )
+        await notify_new_chat(context, user_id, matched_partner)
         
         return IN_CHAT
     
-    # Si no hay pareja, ponernos en lista de espera
-    # Limpiar este usuario de todas las listas de espera primero
-    for key in db.gender_waiting_users:
-        if user_id in db.gender_waiting_users[key]:
-            db.gender_waiting_users[key].remove(user_id)
-    
-    # Añadir al usuario a la lista de quienes buscan este género
-    db.gender_waiting_users[waiting_key].append(user_id)
+    # Si no hay pareja, ponernos en lista de espera (también marca waiting_for_match)
+    db.add_to_waiting_target(user_id, preferred_gender)
     
     # Mostrar mensaje de espera
     keyboard = [[InlineKeyboardButton("❌ Cancelar Búsqueda", callback_data="cancel_search")]]
@@ -1221,11 +1084,6 @@ async def match_by_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reply_markup=reply_markup
     )
     
-    # Marcar en la BD que el usuario está esperando
-    if user_id in db.users:
-        db.users[user_id]["waiting_for_match"] = True
-    
-    db.save_data()
     return WAITING_MATCH
 
 async def end_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1246,6 +1104,30 @@ async def end_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id=N
     
     db.update_user_activity(user_id)
     
+    # Bloquear a ambos miembros de la pareja mientras se cierra el chat y se les avisa
+    async with locked_pair(user_id):
+        return await finish_chat(update, context, user_id)
+
+@contextlib.asynccontextmanager
+async def locked_pair(user_id):
+    """Bloquea al usuario y a su pareja actual. Entrega el ID de la pareja (o None)."""
+    while True:
+        partner_id = db.active_chats.get(user_id)
+        async with pair_locks.locked(user_id, partner_id):
+            # La pareja pudo cambiar mientras se esperaba el lock
+            if db.active_chats.get(user_id) == partner_id:
+                yield partner_id
+                return
+
+async def end_banned_user_chat(context: ContextTypes.DEFAULT_TYPE, user_id) -> None:
+    """Cierra el chat de un usuario recién baneado y avisa a su pareja, con el lock de ambos tomado."""
+    async with locked_pair(user_id) as partner_id:
+        if partner_id is not None:
+            db.end_chat(user_id)
+            await notify_partner_disconnected(context, partner_id)
+
+async def finish_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id) -> int:
+    """Cierra el chat del usuario y avisa a ambos. Se llama con el lock de la pareja tomado."""
     partner_id = db.end_chat(user_id)
     
     if partner_id:
@@ -1257,21 +1139,23 @@ async def end_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id=N
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Usar delete_previous_and_send con clear_all=True para limpiar todos los mensajes
-        await delete_previous_and_send(
-            context,
-            user_id,
-            "❌ Chat finalizado. La otra persona ha sido notificada.",
-            reply_markup=reply_markup,
-            clear_all=True  # Limpiar todo al finalizar chat
-        )
-        
-        await delete_previous_and_send(
-            context,
-            partner_id,
-            "❌ Tu pareja ha finalizado el chat.",
-            reply_markup=reply_markup,
-            clear_all=True  # Limpiar todo al finalizar chat
+        # Usar delete_previous_and_send con clear_all=True para limpiar todos los mensajes,
+        # avisando a ambos usuarios en paralelo
+        await asyncio.gather(
+            delete_previous_and_send(
+                context,
+                user_id,
+                "❌ Chat finalizado. La otra persona ha sido notificada.",
+                reply_markup=reply_markup,
+                clear_all=True  # Limpiar todo al finalizar chat
+            ),
+            delete_previous_and_send(
+                context,
+                partner_id,
+                "❌ Tu pareja ha finalizado el chat.",
+                reply_markup=reply_markup,
+                clear_all=True  # Limpiar todo al finalizar chat
+            )
         )
         
         return ConversationHandler.END
@@ -1306,15 +1190,9 @@ async def cancel_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     user_id = query.from_user.id
     db.update_user_activity(user_id)
     
-    # Remover de las listas de espera antiguas
+    # Remover de las listas de espera
     db.remove_from_waiting(user_id)
     
-    # Remover de las nuevas listas de espera
-    if hasattr(db, 'gender_waiting_users'):
-        for key in db.gender_waiting_users:
-            if user_id in db.gender_waiting_users[key]:
-                db.gender_waiting_users[key].remove(user_id)
-    
     keyboard = [
         [InlineKeyboardButton("🔍 Buscar Pareja", callback_data="find_partner")],
         [InlineKeyboardButton("📊 Estadísticas", callback_data="show_stats")],
@@ -1359,28 +1237,17 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await try_delete_user_message(update)
     return await show_stats(update, context)
 
-async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Muestra las estadísticas del bot."""
-    if isinstance(update, Update) and update.callback_query:
-        query = update.callback_query
-        await query.answer()
-        user_id = query.from_user.id
-    else:
-        user_id = update.effective_user.id
-    
-    db.update_user_activity(user_id)
-    
-    # Calcular estadísticas
-    uptime = format_time_difference(time.time() - db.stats["start_time"])
-    waiting_counts = db.get_waiting_counts()
-    active_counts = db.get_active_counts()
-    gender_stats = db.stats["gender_stats"]
-    
-    # Preparar mensaje de estadísticas
-    stats_message = (
+def render_public_stats(snapshot) -> str:
+    """Genera el mensaje de /stats a partir de una instantánea de StatsService."""
+    stats = snapshot["stats"]
+    waiting_counts = snapshot["waiting"]
+    active_counts = snapshot["active"]
+    gender_stats = stats["gender_stats"]
+    uptime = format_time_difference(time.time() - stats["start_time"])
+    return (
         "📊 *Estadísticas del Bot*\n\n"
-        f"👥 *Usuarios activos ahora:* {len(db.active_chats) // 2 + sum(len(users) for users in db.waiting_users.values())}\n"
-        f"💬 *Conversaciones activas:* {len(db.active_chats) // 2}\n\n"
+        f"👥 *Usuarios activos ahora:* {snapshot['online']}\n"
+        f"💬 *Conversaciones activas:* {snapshot['sessions']}\n\n"
         f"*Usuarios en espera:*\n"
         f"👨 Hombres: {waiting_counts['male']}\n"
         f"👩 Mujeres: {waiting_counts['female']}\n"
@@ -1393,15 +1260,80 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         f"👨 Hombres: {gender_stats['male']}\n"
         f"👩 Mujeres: {gender_stats['female']}\n"
         f"🧑 No Binarios: {gender_stats['non_binary']}\n\n"
-        f"📝 *Total de mensajes:* {db.stats['messages_sent']}\n"
-        f"🔄 *Total de chats iniciados:* {db.stats['total_chats']}\n"
-        f"👥 *Usuarios únicos totales:* {db.stats['total_users']}\n"
-        f"👤 *Usuarios activos (24h):* {db.stats['daily_active_users']}\n\n"
+        f"📝 *Total de mensajes:* {stats['messages_sent']}\n"
+        f"🔄 *Total de chats iniciados:* {stats['total_chats']}\n"
+        f"👥 *Usuarios únicos totales:* {stats['total_users']}\n"
+        f"👤 *Usuarios activos (24h):* {stats['daily_active_users']}\n\n"
         f"⏱️ *Tiempo en línea:* {uptime}\n"
-        f"🔝 *Pico de usuarios:* {db.stats['peak_concurrent_users']} "
-        f"({db.stats['peak_time'] if db.stats['peak_time'] else 'No registrado'})"
+        f"🔝 *Pico de usuarios:* {stats['peak_concurrent_users']} "
+        f"({stats['peak_time'] if stats['peak_time'] else 'No registrado'})"
+    )
+
+def render_admin_panel(snapshot) -> str:
+    """Genera la cabecera del panel de administración."""
+    return (
+        "👑 *Panel de Administrador*\n\n"
+        f"👤 Total de usuarios: {snapshot['stats']['total_users']}\n"
+        f"💬 Conversaciones activas: {snapshot['sessions']}\n"
+        f"🚨 Reportes pendientes: {snapshot['reports']['pending']}\n\n"
+        "Selecciona una opción:"
+    )
+
+def render_admin_stats(snapshot) -> str:
+    """Genera el mensaje de estadísticas detalladas para administradores."""
+    stats = snapshot["stats"]
+    content_types = stats["content_types"]
+    report_counts = snapshot["reports"]
+    
+    stats_message = (
+        "📊 *Estadísticas Detalladas*\n\n"
+        f"👥 *Usuarios registrados:* {stats['total_users']}\n"
+        f"👤 *Usuarios activos (24h):* {stats['daily_active_users']}\n"
+        f"📅 *Usuarios activos (7 días):* {stats['weekly_active_users']}\n"
+        f"🗓️ *Usuarios activos (30 días):* {stats['monthly_active_users']}\n"
+        f"💬 *Chats totales:* {stats['total_chats']}\n"
+        f"📝 *Mensajes enviados:* {stats['messages_sent']}\n\n"
+        f"*Distribución por género:*\n"
     )
     
+    # Los usuarios sin género ("unknown") no se listan
+    total_users = max(1, stats['total_users'])
+    for gender in ("male", "female", "non_binary"):
+        count = stats["gender_stats"].get(gender, 0)
+        gender_name = get_gender_name(gender)
+        emoji = get_gender_emoji(gender)
+        percentage = int(count/total_users*100)
+        stats_message += f"{emoji} {gender_name}: {count} ({percentage}%)\n"
+    
+    stats_message += f"\n*Tipos de contenido:*\n"
+    stats_message += f"💬 Texto: {content_types['text']}\n"
+    stats_message += f"🖼️ Fotos: {content_types['photo']}\n"
+    stats_message += f"😎 Stickers: {content_types['sticker']}\n"
+    stats_message += f"🎤 Audio/Voz: {content_types['voice'] + content_types['audio']}\n"
+    stats_message += f"📹 Videos/GIFs: {content_types['video'] + content_types['video_note'] + content_types['animation']}\n"
+    stats_message += f"📄 Documentos: {content_types['document']}\n"
+    stats_message += f"🧩 Otros: {sum(content_types[t] for t in OTHER_CONTENT_TYPES)}\n\n"
+    
+    stats_message += f"🚨 *Reportes:*\n"
+    stats_message += f"- Pendientes: {report_counts['pending']}\n"
+    stats_message += f"- Resueltos: {report_counts['resolved']}\n"
+    stats_message += f"- Descartados: {report_counts['dismissed']}"
+    return stats_message
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Muestra las estadísticas del bot."""
+    if isinstance(update, Update) and update.callback_query:
+        query = update.callback_query
+        await query.answer()
+        user_id = query.from_user.id
+    else:
+        user_id = update.effective_user.id
+    
+    db.update_user_activity(user_id)
+    
+    # Mensaje de estadísticas (se genera como mucho una vez cada STATS_CACHE_TTL segundos)
+    stats_message = stats_service.render("public", render_public_stats)
+    
     keyboard = [[InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -1454,6 +1386,34 @@ async def report_reason(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     
     return REPORT_EVIDENCE
 
+async def notify_admins_of_report(context: ContextTypes.DEFAULT_TYPE, report_id, reporter_id, reported_id, reason, evidence_file_id):
+    """Envía un reporte nuevo a todos los administradores en paralelo."""
+    text = (
+        f"🚨 *Nuevo Reporte #{report_id}*\n\n"
+        f"*De:* Usuario #{reporter_id}\n"
+        f"*Contra:* Usuario #{reported_id}\n"
+        f"*Motivo:* {reason}"
+    )
+    
+    async def send_report(admin_id):
+        if evidence_file_id:
+            await context.bot.send_photo(
+                chat_id=admin_id, photo=evidence_file_id, caption=text, parse_mode='HTML',
+                rate_limit_args=PRIORITY_BACKGROUND
+            )
+        else:
+            await context.bot.send_message(
+                chat_id=admin_id,
+                text=text + "\n*Evidencia:* No proporcionada",
+                parse_mode='HTML',
+                rate_limit_args=PRIORITY_BACKGROUND
+            )
+    
+    delivery = await fan_out(send_report, db.admins)
+    delivered = sum(1 for error in delivery.values() if error is None)
+    logger.info(f"Reporte #{report_id} entregado a {delivered}/{len(delivery)} administradores")
+    return delivery
+
 async def report_evidence(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Recibe la evidencia del reporte."""
     user_id = update.effective_user.id
@@ -1475,31 +1435,10 @@ async def report_evidence(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Crear el reporte
     report_id = db.add_report(user_id, reported_id, reason, evidence_file_id)
     
-    # Notificar a los administradores
-    for admin_id in db.admins:
-        try:
-            if evidence_file_id:
-                await context.bot.send_photo(
-                    chat_id=admin_id,
-                    photo=evidence_file_id,
-                    caption=f"🚨 *Nuevo Reporte #{report_id}*\n\n"
-                            f"*De:* Usuario #{user_id}\n"
-                            f"*Contra:* Usuario #{reported_id}\n"
-                            f"*Motivo:* {reason}",
-                    parse_mode='HTML'
-                )
-            else:
-                                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"🚨 *Nuevo Reporte #{report_id}*\n\n"
-                         f"*De:* Usuario #{user_id}\n"
-                         f"*Contra:* Usuario #{reported_id}\n"
-                         f"*Motivo:* {reason}\n"
-                         f"*Evidencia:* No proporcionada",
-                    parse_mode='HTML'
-                )
-        except Exception as e:
-            logger.error(f"Error al enviar reporte a admin {admin_id}: {e}")
+    # Notificar a los administradores en segundo plano para no retrasar la confirmación
+    context.application.create_task(
+        notify_admins_of_report(context, report_id, user_id, reported_id, reason, evidence_file_id)
+    )
     
     # Confirmar al usuario
     await update.message.reply_text(
@@ -1532,17 +1471,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     
     # Obtener estadísticas para el panel admin
-    total_users = db.stats["total_users"]
-    active_chats = len(db.active_chats) // 2
-    pending_reports = sum(1 for r in db.reports if r.get("status") == "pending")
-    
-    admin_message = (
-        "👑 *Panel de Administrador*\n\n"
-        f"👤 Total de usuarios: {total_users}\n"
-        f"💬 Conversaciones activas: {active_chats}\n"
-        f"🚨 Reportes pendientes: {pending_reports}\n\n"
-        "Selecciona una opción:"
-    )
+    admin_message = stats_service.render("admin_panel", render_admin_panel)
     
     keyboard = [
         [InlineKeyboardButton("📊 Ver Estadísticas Detalladas", callback_data="admin_stats")],
@@ -1571,9 +1500,9 @@ async def view_reports(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
     
     # Obtener los reportes pendientes
-    pending_reports = [r for r in db.reports if r.get("status") == "pending"]
+    pending = db.reports.next_pending()
     
-    if not pending_reports:
+    if pending is None:
         keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -1584,8 +1513,7 @@ async def view_reports(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
     
     # Mostrar el primer reporte pendiente
-    report = pending_reports[0]
-    report_id = db.reports.index(report)
+    report_id, report = pending
     
     reporter_id = report["reporter_id"]
     reported_id = report["reported_id"]
@@ -1649,24 +1577,12 @@ async def handle_report_action(update: Update, context: ContextTypes.DEFAULT_TYP
     
     action, report_id = query.data.split("_")[0], int(query.data.split("_")[2])
     
-    if report_id >= len(db.reports):
+    status = "resolved" if action == "resolve" else "dismissed"
+    if db.set_report_status(report_id, status, user_id) is None:
         await query.edit_message_text("Este reporte ya no existe.")
         return
     
-    report = db.reports[report_id]
-    
-    if action == "resolve":
-        report["status"] = "resolved"
-        report["resolved_by"] = user_id
-        report["resolved_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        status_msg = "resuelto"
-    else:  # dismiss
-        report["status"] = "dismissed"
-        report["dismissed_by"] = user_id
-        report["dismissed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        status_msg = "descartado"
-    
-    db.save_data()
+    status_msg = "resuelto" if action == "resolve" else "descartado"
     
     keyboard = [[InlineKeyboardButton("🔙 Volver a Reportes", callback_data="view_reports")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1689,22 +1605,8 @@ async def ban_user_action(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     target_id = int(query.data.split("_")[2])
     
     if db.ban_user(target_id):
-        # Si el usuario estaba en un chat, notificar a su pareja
-        if target_id in db.active_chats:
-            partner_id = db.active_chats[target_id]
-            db.end_chat(target_id)
-            
-            keyboard = [
-                [InlineKeyboardButton("🔍 Buscar Otra Pareja", callback_data="find_partner")],
-                [InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await context.bot.send_message(
-                chat_id=partner_id,
-                text="❗ Tu pareja ha sido desconectada por un administrador.",
-                reply_markup=reply_markup
-            )
+        # Si el usuario estaba en un chat, finalizarlo y notificar a su pareja
+        await end_banned_user_chat(context, target_id)
         
         keyboard = [[InlineKeyboardButton("🔙 Volver a Reportes", callback_data="view_reports")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1732,32 +1634,8 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await query.edit_message_text("No tienes permisos para acceder a esta función.")
         return
     
-    # Estadísticas detalladas
-    content_types = db.stats["content_types"]
-    gender_stats = db.stats["gender_stats"]
-    
-    stats_message = (
-        "📊 *Estadísticas Detalladas*\n\n"
-        f"👥 *Usuarios registrados:* {db.stats['total_users']}\n"
-        f"👤 *Usuarios activos (24h):* {db.stats['daily_active_users']}\n"
-        f"💬 *Chats totales:* {db.stats['total_chats']}\n"
-        f"📝 *Mensajes enviados:* {db.stats['messages_sent']}\n\n"
-        f"*Distribución por género:*\n"
-        f"👨 Hombres: {gender_stats['male']} ({int(gender_stats['male']/max(1, db.stats['total_users'])*100)}%)\n"
-        f"👩 Mujeres: {gender_stats['female']} ({int(gender_stats['female']/max(1, db.stats['total_users'])*100)}%)\n"
-        f"🧑 No Binarios: {gender_stats['non_binary']} ({int(gender_stats['non_binary']/max(1, db.stats['total_users'])*100)}%)\n\n"
-        f"*Tipos de contenido:*\n"
-        f"💬 Texto: {content_types['text']}\n"
-        f"🖼️ Fotos: {content_types['photo']}\n"
-        f"😎 Stickers: {content_types['sticker']}\n"
-        f"🎤 Audio/Voz: {content_types['voice'] + content_types['audio']}\n"
-        f"📹 Videos/GIFs: {content_types['video'] + content_types['animation']}\n"
-        f"📄 Documentos: {content_types['document']}\n\n"
-        f"🚨 *Reportes:*\n"
-        f"- Pendientes: {sum(1 for r in db.reports if r.get('status') == 'pending')}\n"
-        f"- Resueltos: {sum(1 for r in db.reports if r.get('status') == 'resolved')}\n"
-        f"- Descartados: {sum(1 for r in db.reports if r.get('status') == 'dismissed')}"
-    )
+    # Estadísticas detalladas (compartidas con AdminCommands.show_admin_stats)
+    stats_message = stats_service.render("admin_stats", render_admin_stats)
     
     keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1881,89 +1759,77 @@ async def remove_admin_finish(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     return ConversationHandler.END
 
+def classify_message(message):
+    """Devuelve el tipo de contenido del mensaje según el primer atributo presente."""
+    for content_type in RELAY_CONTENT_TYPES:
+        if getattr(message, content_type, None):
+            return content_type
+    return "other"
+
+async def relay_album(context, user_id, partner_id, messages):
+    """Reenvía un álbum completo al compañero con un solo send_media_group."""
+    # El chat puede haber terminado mientras se completaba el álbum
+    if db.active_chats.get(user_id) != partner_id:
+        return
+    
+    media = [to_input_media(message) for message in messages]
+    if None in media:
+        # Parte que no admite send_media_group: copiar una a una
+        for message in messages:
+            await context.bot.copy_message(
+                chat_id=partner_id, from_chat_id=message.chat_id, message_id=message.message_id,
+                rate_limit_args=PRIORITY_RELAY
+            )
+        return
+    await context.bot.send_media_group(chat_id=partner_id, media=media, rate_limit_args=PRIORITY_RELAY)
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Maneja los mensajes enviados por los usuarios."""
     user_id = update.effective_user.id
-    db.update_user_activity(user_id)
-    
-    # Verificar si el usuario está baneado
-    if user_id in db.users and db.users[user_id].get("banned", False):
-        await delete_previous_and_send(context, user_id, "Lo sentimos, tu acceso a este bot ha sido restringido.")
-        return
     
     # Verificar si el usuario está en un chat activo
     if user_id in db.active_chats:
         partner_id = db.active_chats[user_id]
         
-        # Actualizar estadísticas de mensajes
-        message_type = "text"
-        if update.message.text:
-            message_type = "text"
-        elif update.message.sticker:
-            message_type = "sticker"
-        elif update.message.photo:
-            message_type = "photo"
-        elif update.message.voice:
-            message_type = "voice"
-        elif update.message.video:
-            message_type = "video"
-        elif update.message.animation:
-            message_type = "animation"
-        elif update.message.document:
-            message_type = "document"
-        elif update.message.audio:
-            message_type = "audio"
+        # Clasificar una sola vez: sirve para el límite de spam y las estadísticas; el reenvío es igual para todos
+        message_type = classify_message(update.message)
+        
+        in_cooldown, remaining = spam_limiter.check(user_id, message_type)
+        if in_cooldown:
+            # Avisar una sola vez por cooldown: el resto del flood se descarta sin llamar a la API
+            if spam_limiter.take_warning(user_id):
+                await update.message.reply_text(
+                    f"⚠️ Estás enviando mensajes demasiado rápido. Espera {remaining} segundos."
+                )
+            return
         
+        # La actividad se registra después del límite: el flood descartado no toca la persistencia
+        db.update_user_activity(user_id)
         db.update_message_stats(message_type)
         
-        # Reenviar el mensaje al compañero
-        if update.message.text:
-            await context.bot.send_message(chat_id=partner_id, text=update.message.text)
-            
-        elif update.message.sticker:
-            await context.bot.send_sticker(chat_id=partner_id, sticker=update.message.sticker.file_id)
-            
-        elif update.message.photo:
-            await context.bot.send_photo(
-                chat_id=partner_id,
-                photo=update.message.photo[-1].file_id,
-                caption=update.message.caption
-            )
-            
-        elif update.message.voice:
-            await context.bot.send_voice(
-                chat_id=partner_id,
-                voice=update.message.voice.file_id
-            )
-            
-        elif update.message.video:
-            await context.bot.send_video(
-                chat_id=partner_id,
-                video=update.message.video.file_id,
-                caption=update.message.caption
-            )
-            
-        elif update.message.animation:
-            await context.bot.send_animation(
-                chat_id=partner_id,
-                animation=update.message.animation.file_id
-            )
-            
-        elif update.message.document:
-            await context.bot.send_document(
-                chat_id=partner_id,
-                document=update.message.document.file_id,
-                caption=update.message.caption
-            )
-            
-        elif update.message.audio:
-            await context.bot.send_audio(
+        # Las partes de un álbum se acumulan y se reenvían juntas
+        if update.message.media_group_id:
+            album_buffer.add(update.message, lambda messages: relay_album(context, user_id, partner_id, messages))
+            return
+        
+        # Un álbum enviado justo antes tiene que llegar antes que este mensaje
+        await album_buffer.drain(update.effective_chat.id)
+        
+        # Copiar el mensaje al compañero tal cual (entidades, pies de foto, encuestas...)
+        try:
+            await context.bot.copy_message(
                 chat_id=partner_id,
-                audio=update.message.audio.file_id,
-                caption=update.message.caption
+                from_chat_id=update.effective_chat.id,
+                message_id=update.message.message_id,
+                rate_limit_args=PRIORITY_RELAY
             )
+        except BadRequest as e:
+            # Mensajes que Telegram no permite copiar (p. ej. encuestas tipo quiz)
+            logger.warning(f"No se pudo reenviar el mensaje de {user_id} a {partner_id}: {e}")
+            await update.message.reply_text("❌ Este tipo de mensaje no se puede enviar a tu pareja.")
     else:
         # El usuario no está en un chat activo
+        db.update_user_activity(user_id)
         keyboard = [
             [InlineKeyboardButton("🔍 Buscar Pareja", callback_data="find_partner")],
             [InlineKeyboardButton("📊 Estadísticas", callback_data="show_stats")],
@@ -2039,10 +1905,64 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     logger.warning(f"Callback no manejado: {query.data} de usuario {query.from_user.id}")
     return ConversationHandler.END
 
+async def ban_guard(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Descarta los updates de usuarios baneados antes de que lleguen a cualquier otro manejador."""
+    user = update.effective_user if isinstance(update, Update) else None
+    if user is None or not db.is_banned(user.id):
+        return
+    
+    if update.callback_query:
+        # Hay que responder siempre al callback para que el cliente deje de esperar
+        await update.callback_query.answer(BANNED_MESSAGE, show_alert=True)
+    elif user.id not in ban_notices:
+        ban_notices.set(user.id, True)
+        await delete_previous_and_send(context, user.id, BANNED_MESSAGE)
+    raise ApplicationHandlerStop
+
+async def flush_data_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Escribe a disco los cambios pendientes del almacén de datos."""
+    try:
+        # Los contadores de usuarios activos se guardan al día aunque nadie consulte las estadísticas
+        db.update_daily_active_users()
+        await db.flush_async()
+    except Exception as e:
+        logger.error(f"Error al guardar datos: {e}")
+
+async def evict_spam_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Descarta el estado de spam de los usuarios inactivos."""
+    evicted = spam_limiter.evict_idle()
+    if evicted:
+        logger.debug(f"Limitador de spam: {evicted} usuarios inactivos descartados")
+
+async def on_stop(application: Application) -> None:
+    """Reenvía los álbumes pendientes mientras el bot aún puede enviar mensajes."""
+    await album_buffer.close()
+
+async def on_shutdown(application: Application) -> None:
+    """Guarda los cambios pendientes antes de apagar el bot."""
+    db.close()
+
 def main() -> None:
     """Función principal para iniciar el bot."""
     # Crear la aplicación
-    application = Application.builder().token(TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .rate_limiter(OutboundScheduler(global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE))
+        .concurrent_updates(OrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    # Persistencia diferida: agrupar escrituras en una por intervalo
+    application.job_queue.run_repeating(flush_data_job, interval=SAVE_INTERVAL, first=SAVE_INTERVAL)
+    
+    # Emparejamiento periódico en bloque de los usuarios en espera
+    application.job_queue.run_repeating(matchmaking_job, interval=MATCH_INTERVAL, first=MATCH_INTERVAL)
+    
+    # Limpieza periódica del limitador de spam
+    application.job_queue.run_repeating(evict_spam_job, interval=300, first=300)
 
     # Inicializar y registrar los comandos de administrador
     global admin_cmds  # Hacemos la variable global para accederla desde otras funciones
@@ -2123,56 +2043,141 @@ def main() -> None:
     # Callback general para botones - Asegúrate de que este sea el último handler
     application.add_handler(CallbackQueryHandler(button_callback))
     
-    # Manejo de mensajes
-    class ShouldHandleMessageFilter(filters.MessageFilter):
-        def filter(self, message):
-            user_id = message.from_user.id
-            # No procesar si el usuario está en un proceso de entrada de ID admin
-            return not (hasattr(application, 'temp_handlers') and user_id in application.temp_handlers)
-
-    should_handle_filter = ShouldHandleMessageFilter()
-    
+    # Manejo de mensajes (las respuestas a peticiones de ID ya las captura admin_cmds antes)
     application.add_handler(
         MessageHandler(
-            filters.ALL & ~filters.COMMAND & should_handle_filter,
+            filters.ALL & ~filters.COMMAND,
             handle_message
         )
     )
+    
+    # Control de baneos (grupo -2): lo primero que ve cada update, antes de estadísticas o persistencia
+    application.add_handler(TypeHandler(Update, ban_guard), group=-2)
+    
+    # Enrutado previo (grupo -1): los mensajes de usuarios en un chat activo, que son
+    # la mayor parte del tráfico, van directos al reenvío sin recorrer el resto de manejadores
+    class InActiveChatFilter(filters.MessageFilter):
+        def filter(self, message):
+            return message.from_user is not None and message.from_user.id in db.active_chats
+    
+    async def relay_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Los mensajes que espera una conversación (p. ej. el motivo de un reporte) siguen el camino normal;
+        # las respuestas a peticiones de ID de administración ya se excluyen en el filtro
+        if report_conv_handler.check_update(update):
+            return
+        try:
+            await handle_message(update, context)
+        except Exception as e:
+            # Sin manejador de errores PTB seguiría con el grupo 0 y reenviaría el mensaje otra vez
+            logger.error(f"Error al reenviar el mensaje de {update.effective_user.id}: {e}")
+        raise ApplicationHandlerStop
+    
+    application.add_handler(
+        MessageHandler(
+            filters.UpdateType.MESSAGE & ~filters.COMMAND & InActiveChatFilter() & ~admin_cmds.pending_input_filter,
+            relay_router
+        ),
+        group=-1
+    )
+    
+    # Pedir a Telegram solo los tipos de update que algún manejador procesa
+    allowed_updates = get_allowed_updates(application)
+    logger.info(f"Tipos de update solicitados: {', '.join(allowed_updates)}")
 
     # Iniciar el bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        run_webhook(application, allowed_updates)
+    else:
+        application.run_polling(allowed_updates=allowed_updates)
+
+# Tipos de update que necesita cada clase de manejador (los manejadores usan
+# update.message, así que los mensajes editados y de canales no se piden)
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: {Update.MESSAGE},
+    MessageHandler: {Update.MESSAGE},
+    CallbackQueryHandler: {Update.CALLBACK_QUERY},
+    # Filtro previo sobre los updates que piden los demás manejadores; no añade tipos propios
+    TypeHandler: set()
+}
+
+def get_allowed_updates(application: Application) -> list:
+    """Deduce de los manejadores registrados qué tipos de update hay que pedir a Telegram."""
+    pending = [handler for handlers in application.handlers.values() for handler in handlers]
+    allowed = set()
+    while pending:
+        handler = pending.pop()
+        if isinstance(handler, ConversationHandler):
+            pending += handler.entry_points + handler.fallbacks
+            for state_handlers in handler.states.values():
+                pending += state_handlers
+            continue
+        update_types = HANDLER_UPDATE_TYPES.get(type(handler))
+        if update_types is None:
+            # Manejador desconocido: mejor pedirlo todo que perder updates
+            return Update.ALL_TYPES
+        allowed |= update_types
+    return sorted(allowed)
+
+def run_webhook(application: Application, allowed_updates) -> None:
+    """Recibe los updates por webhook con el servidor HTTP integrado de python-telegram-bot.
+    
+    Telegram hace POST a WEBHOOK_URL/WEBHOOK_PATH y el servidor rechaza las peticiones
+    cuya cabecera X-Telegram-Bot-Api-Secret-Token no coincide con WEBHOOK_SECRET.
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("BOT_MODE=webhook requiere definir WEBHOOK_URL")
+    
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET no definido: se usa un token aleatorio para esta ejecución")
+    
+    logger.info(f"Escuchando webhooks en {WEBHOOK_LISTEN}:{PORT}/{WEBHOOK_PATH}")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=secret_token,
+        allowed_updates=allowed_updates
+    )
 
 # Añadir esto antes de la función main()
 
 # Rastreo de mensajes
-last_bot_messages = {}  # {user_id: [{"chat_id": chat_id, "message_id": message_id}, ...]}
 MAX_TRACKED_MESSAGES = 10  # Número máximo de mensajes a rastrear por usuario
+MAX_TRACKED_USERS = 50000  # Usuarios con mensajes rastreados como máximo (se olvidan los menos recientes)
+TRACKED_MESSAGES_TTL = 48 * 3600  # Telegram no deja borrar mensajes del bot más antiguos que esto
+last_bot_messages = TTLMap(ttl=TRACKED_MESSAGES_TTL, maxsize=MAX_TRACKED_USERS)  # {user_id: deque[(chat_id, message_id)]}
+
+async def delete_messages(context, user_id, msgs_to_delete):
+    """Elimina varios mensajes del bot a la vez."""
+    results = await asyncio.gather(
+        *(context.bot.delete_message(
+            chat_id=chat_id, message_id=message_id, rate_limit_args=PRIORITY_BACKGROUND
+        ) for chat_id, message_id in msgs_to_delete),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.debug(f"No se pudo eliminar mensaje para {user_id}: {result}")
 
 async def delete_previous_and_send(context, user_id, text, reply_markup=None, parse_mode='HTML', clear_all=False):
     """Elimina mensajes anteriores y envía uno nuevo.
     
     Si clear_all=True, intenta eliminar todos los mensajes rastreados.
     """
-    if user_id in last_bot_messages:
-        # Determinar cuántos mensajes borrar
-        msgs_to_delete = last_bot_messages[user_id]
-        
-        if not clear_all:
-            # Si no es clear_all, solo borrar el último
-            msgs_to_delete = msgs_to_delete[-1:]
-        
-        # Borrar mensajes
-        for msg_info in msgs_to_delete:
-            try:
-                chat_id = msg_info["chat_id"]
-                message_id = msg_info["message_id"]
-                await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            except Exception as e:
-                logger.debug(f"No se pudo eliminar mensaje para {user_id}: {e}")
-        
-        # Limpiar la lista si borramos todos
+    tracked = last_bot_messages.get(user_id)
+    if tracked:
+        # Borrar todos los mensajes rastreados o solo el último
         if clear_all:
-            last_bot_messages[user_id] = []
+            msgs_to_delete = list(tracked)
+            tracked.clear()
+        else:
+            msgs_to_delete = [tracked.pop()]
+        
+        # Borrar en paralelo y sin esperar: el nuevo mensaje no depende de los borrados
+        context.application.create_task(delete_messages(context, user_id, msgs_to_delete))
     
     # Enviar nuevo mensaje
     message = await context.bot.send_message(
@@ -2182,22 +2187,15 @@ async def delete_previous_and_send(context, user_id, text, reply_markup=None, pa
         parse_mode=parse_mode
     )
     
-    # Registrar el nuevo mensaje
-    if user_id not in last_bot_messages:
-        last_bot_messages[user_id] = []
-    
-    last_bot_messages[user_id].append({
-        "chat_id": message.chat_id,
-        "message_id": message.message_id
-    })
-    
-    # Mantener el registro dentro de un tamaño razonable
-    if len(last_bot_messages[user_id]) > MAX_TRACKED_MESSAGES:
-        last_bot_messages[user_id] = last_bot_messages[user_id][-MAX_TRACKED_MESSAGES:]
+    # Registrar el nuevo mensaje; la deque descarta sola los más antiguos
+    tracked = last_bot_messages.get(user_id)
+    if tracked is None:
+        tracked = deque(maxlen=MAX_TRACKED_MESSAGES)
+    tracked.append((message.chat_id, message.message_id))
+    last_bot_messages.set(user_id, tracked)
     
     return message
 
-
 async def try_delete_user_message(update: Update):
     """Intenta eliminar el mensaje del usuario."""
     try:
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLocks:
+    """Un asyncio.Lock por clave, creado bajo demanda y descartado cuando nadie lo usa."""
+
+    def __init__(self):
+        self._locks = {}  # {clave: [lock, tareas que lo usan o esperan]}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @contextlib.asynccontextmanager
+    async def locked(self, *keys):
+        """Adquiere los locks de todas las claves (se ignoran las None).
+
+        Se toman siempre en orden ascendente, así dos tareas que bloquean la
+        misma pareja de usuarios nunca se esperan mutuamente.
+        """
+        entries = []
+        for key in sorted({key for key in keys if key is not None}):
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            entries.append((key, entry))
+
+        acquired = []
+        try:
+            for _, entry in entries:
+                await entry[0].acquire()
+                acquired.append(entry[0])
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for key, entry in entries:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Procesa updates en paralelo salvo los de un mismo usuario, que van en orden de llegada.
+
+    Los updates sin usuario se serializan por chat, y los que no tienen ninguno
+    de los dos se procesan sin restricción.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = KeyedLocks()
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        # process_update() es final en PTB y toma el semáforo antes de llamar aquí,
+        # así que los updates en espera de un mismo usuario ocupan huecos de concurrencia
+        async with self._locks.locked(self._key(update)):
+            await coroutine
+
+    async def initialize(self):
+        """No necesita inicialización."""
+
+    async def shutdown(self):
+        """No mantiene recursos abiertos."""
@@ -1,32 +1,52 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
-import json
 import time
+import asyncio
 import logging
 from datetime import datetime
 
+from storage import COLLECTION_FILES, JsonStorage
+from activity import ActivityWindow
+from matchmaking import GENDERS, MatchQueues
+from reports import ReportStore
+from users import UserRecord
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
-# Rutas de archivos para persistencia
-DATA_DIR = "data"
-USERS_FILE = os.path.join(DATA_DIR, "users.json")
-STATS_FILE = os.path.join(DATA_DIR, "stats.json")
-REPORTS_FILE = os.path.join(DATA_DIR, "reports.json")
+# Tipos de contenido que se contabilizan, en orden de prioridad: un mensaje se
+# clasifica por el primer atributo presente (una animación también trae
+# "document" y un lugar también trae "location"). "other" recoge el resto.
+CONTENT_TYPES = (
+    "text", "sticker", "photo", "voice", "video", "video_note", "animation", "document",
+    "audio", "venue", "location", "contact", "poll", "dice", "other"
+)
+
+
+def _parse_user_id(key):
+    """Convierte una clave persistida (texto en JSON) en el ID entero del usuario, o None si no es válida."""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return None
+
 
 class DataStore:
-    def __init__(self, super_admin_id):
+    def __init__(self, super_admin_id, storage=None):
         """Inicializa el almacén de datos."""
         self.super_admin_id = super_admin_id
-        self.users = {}  # {user_id: {"gender": "male", "role": "user", "paired_with": None}}
-        self.waiting_users = {"male": [], "female": [], "non_binary": []}
+        self.storage = storage or JsonStorage()
+        self.users = {}  # {user_id (int): UserRecord}
         self.active_chats = {}  # {user_id: partner_id}
-        self.gender_waiting_users = {}
+        self.gender_waiting_users = MatchQueues()  # Colas de espera por (género propio, género buscado)
         self.admins = set([super_admin_id])  # Conjunto de IDs de administradores
-        self.reports = []  # Lista de reportes
-        self.spam_control = {}  # {user_id: {"message_count": 0, "first_message_time": timestamp, "cooldown_until": timestamp}}
+        self.banned = set()  # Conjunto de IDs de usuarios baneados
+        self.reports = ReportStore()  # Reportes indexados por ID, estado y usuario
+        # Contadores mantenidos al modificar los datos, para que las estadísticas no recorran colecciones
+        self.active_gender_counts = dict.fromkeys(GENDERS, 0)  # Usuarios en un chat, por género
+        self._active_genders = {}  # {user_id: género con el que se contó al entrar al chat}
+        self._stats_listeners = []  # Funciones a llamar cuando cambian reportes o baneos
         self.stats = {
             "total_users": 0,
             "total_chats": 0,
@@ -34,121 +54,242 @@ class DataStore:
             "messages_sent": 0,
             "start_time": time.time(),
             "daily_active_users": 0,
+            "weekly_active_users": 0,
+            "monthly_active_users": 0,
             "user_last_active": {},
             "peak_concurrent_users": 0,
             "peak_time": None,
-            "content_types": {
-                "text": 0, "sticker": 0, "photo": 0, "voice": 0,
-                "video": 0, "animation": 0, "document": 0, "audio": 0
-            },
+            "content_types": dict.fromkeys(CONTENT_TYPES, 0),
             "gender_stats": {"male": 0, "female": 0, "non_binary": 0}
         }
         self.super_admin_id = super_admin_id
+        self._dirty = {}  # {colección: claves modificadas, o None si cambió entera}
         self.load_data()
 
         # Reiniciar tiempo de inicio para reflejar el arranque actual del bot
         self.stats["start_time"] = time.time()
+        self.mark_dirty("stats", "start_time")
 
     def load_data(self):
-        """Carga datos desde archivos JSON si existen."""
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-        if os.path.isfile(USERS_FILE):
-            with open(USERS_FILE, "r", encoding="utf-8") as f:
-                self.users = json.load(f)
-        if os.path.isfile(STATS_FILE):
-            with open(STATS_FILE, "r", encoding="utf-8") as f:
-                self.stats = json.load(f)
-        if os.path.isfile(REPORTS_FILE):
-            with open(REPORTS_FILE, "r", encoding="utf-8") as f:
-                self.reports = json.load(f)
-        
-        # Verificar que self.users es un diccionario
-        if not isinstance(self.users, dict):
+        """Carga los datos desde el backend de almacenamiento."""
+        loaded = self.storage.load()
+        self.stats = loaded.get("stats", self.stats)
+        self.reports = ReportStore(loaded.get("reports"))
+        
+        # Verificar que los usuarios son un diccionario y pasarlos a registros compactos
+        users = loaded.get("users", {})
+        if not isinstance(users, dict):
             logger.warning("users.json no tiene formato de diccionario. Reiniciando a vacío.")
-            self.users = {}
+            users = {}
+        # Las claves JSON son texto: se normalizan una sola vez a int, el tipo que usa el bot.
+        # En la misma pasada se reconstruyen los índices de admins y baneados
+        self.users = {}
+        for uid, data in users.items():
+            user_id = _parse_user_id(uid)
+            if user_id is None or not isinstance(data, dict):
+                logger.warning(f"Datos inválidos para el usuario {uid!r}, descartados")
+                continue
+            user = self.users[user_id] = UserRecord.from_dict(data)
+            if user.get("role") == "admin":
+                self.admins.add(user_id)
+            if user.get("banned"):
+                self.banned.add(user_id)
+        
+        # Añadir los tipos de contenido nuevos a estadísticas guardadas antes
+        content_types = self.stats.setdefault("content_types", {})
+        for content_type in CONTENT_TYPES:
+            content_types.setdefault(content_type, 0)
+        
+        # Restaurar los chats y las colas de espera de la ejecución anterior
+        self._restore_sessions(loaded.get("sessions"))
+        
+        # Índice de actividad por ventanas de tiempo sobre user_last_active (también con claves int)
+        user_last_active = {}
+        for uid, timestamp in self.stats.get("user_last_active", {}).items():
+            user_id = _parse_user_id(uid)
+            if user_id is not None:
+                user_last_active[user_id] = timestamp
+        self.stats["user_last_active"] = user_last_active
+        self.activity = ActivityWindow(
+            self.stats["user_last_active"],
+            on_evict=lambda user_id: self.mark_dirty("stats", ("user_last_active", user_id))
+        )
+        self.update_daily_active_users()
         
-        # Cargar admins desde self.users
-        for uid, data in self.users.items():
-            if isinstance(data, dict) and data.get("role") == "admin":
-                self.admins.add(int(uid))
+        # Reconstruir los contadores de género una sola vez al arrancar
+        self.update_gender_stats()
         
-        logger.info(f"Datos cargados: {len(self.users)} usuarios, {len(self.admins)} administradores, {len(self.active_chats)/2} chats activos")
+        logger.info(f"Datos cargados: {len(self.users)} usuarios, {len(self.admins)} administradores, {len(self.active_chats) // 2} chats activos, {len(self.gender_waiting_users)} en espera")
 
     def add_to_waiting_target(self, user_id, target_gender):
         """Añade un usuario a la lista de espera del género objetivo."""
-        # Asegurarnos que el usuario no está en ninguna lista de espera
-        self.remove_from_waiting(user_id)
+        # Normalizar valor de género para la consistencia
+        if target_gender == "nonbinary":
+            target_gender = "non_binary"
         
-        # Añadir al usuario a la lista del género que está buscando
-        if target_gender not in self.waiting_users:
-            self.waiting_users[target_gender] = []
+        # enqueue() ya lo saca de cualquier otra cola
+        own_gender = self.users[user_id].get("gender") if user_id in self.users else None
+        self.gender_waiting_users.enqueue(user_id, own_gender, target_gender)
         
-        self.waiting_users[target_gender].append(user_id)
+        if user_id in self.users:
+            self.users[user_id]["waiting_for_match"] = True
+            self.mark_dirty("users", user_id)
+        self.update_peak_users()
+        self.save_data("sessions")
+
+    @property
+    def sessions(self):
+        """Instantánea de los chats activos y las colas de espera, tal como se persiste."""
+        return {
+            "active_chats": {str(user_id): partner_id for user_id, partner_id in self.active_chats.items()},
+            "waiting": self.gender_waiting_users.entries()
+        }
+
+    def _restore_sessions(self, sessions):
+        """Restaura chats y colas de espera y corrige paired_with/waiting_for_match de los usuarios.
+
+        Sin instantánea (datos de versiones anteriores) los chats se deducen de paired_with.
+        Solo se restauran los chats recíprocos entre usuarios existentes y no baneados.
+        """
+        if sessions is None:
+            chats = {
+                user_id: data["paired_with"] for user_id, data in self.users.items()
+                if data.get("paired_with") is not None
+            }
+            waiting = []
+        else:
+            chats = {int(uid): partner_id for uid, partner_id in sessions.get("active_chats", {}).items()}
+            waiting = sessions.get("waiting", [])
+
+        for user_id, partner_id in chats.items():
+            user, partner = self.users.get(user_id), self.users.get(partner_id)
+            if (user_id != partner_id and chats.get(partner_id) == user_id and user and partner
+                    and not user.get("banned") and not partner.get("banned")):
+                self.active_chats[user_id] = partner_id
+
+        for user_id, _, wanted_gender, joined_at in waiting:
+            user = self.users.get(user_id)
+            if user and not user.get("banned") and user_id not in self.active_chats:
+                self.gender_waiting_users.enqueue(user_id, user.get("gender"), wanted_gender, joined_at)
+
+        # Dejar los campos de cada usuario de acuerdo con lo restaurado
+        for user_id, data in self.users.items():
+            partner_id = self.active_chats.get(user_id)
+            waiting_for_match = user_id in self.gender_waiting_users
+            if data.get("paired_with") != partner_id or data.get("waiting_for_match", False) != waiting_for_match:
+                data["paired_with"] = partner_id
+                data["waiting_for_match"] = waiting_for_match
+                self.mark_dirty("users", user_id)
+
+        self.active_gender_counts = dict.fromkeys(GENDERS, 0)
+        self._active_genders = {}
+        for user_id in self.active_chats:
+            self._count_active(user_id, 1)
+
+        self.stats["active_sessions"] = len(self.active_chats) // 2
+        self.mark_dirty("stats", "active_sessions")
+
+    def save_data(self, *collections):
+        """Marca colecciones completas como modificadas (todas si no se indica ninguna).
+
+        La escritura real la hace flush(), que se ejecuta periódicamente y al apagar el bot.
+        """
+        for collection in collections or COLLECTION_FILES:
+            self._dirty[collection] = None
 
-    def save_data(self):
-        """Guarda datos a archivos JSON."""
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.users, f, ensure_ascii=False, indent=2)
-        with open(STATS_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.stats, f, ensure_ascii=False, indent=2)
-        with open(REPORTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.reports, f, ensure_ascii=False, indent=2)
+    def mark_dirty(self, collection, *keys):
+        """Marca claves concretas de una colección como modificadas.
+
+        Las claves anidadas se indican como tuplas, p. ej. ("user_last_active", 123).
+        """
+        if collection in self._dirty and self._dirty[collection] is None:
+            return
+        self._dirty.setdefault(collection, set()).update(keys)
+
+    def on_stats_change(self, callback):
+        """Registra una función que se llama sin argumentos al cambiar reportes o baneos."""
+        self._stats_listeners.append(callback)
+
+    def _stats_changed(self):
+        for callback in self._stats_listeners:
+            callback()
+
+    def _take_dirty(self):
+        """Prepara el lote de cambios pendientes y limpia el registro de modificados."""
+        # Solo las colecciones modificadas: "sessions" es una propiedad que se reconstruye al leerla
+        collections = {name: getattr(self, name) for name in self._dirty}
+        batch = self.storage.prepare(collections, self._dirty)
+        self._dirty = {}
+        return batch
+
+    def flush(self):
+        """Escribe a disco los cambios pendientes."""
+        if self._dirty:
+            self.storage.commit(self._take_dirty())
+
+    def close(self):
+        """Escribe los cambios pendientes y libera el backend de almacenamiento."""
+        self.flush()
+        self.storage.close()
+
+    async def flush_async(self):
+        """Como flush(), pero la escritura a disco se hace fuera del event loop."""
+        if not self._dirty:
+            return
+        pending = self._dirty
+        batch = self._take_dirty()
+        try:
+            await asyncio.to_thread(self.storage.commit, batch)
+        except Exception:
+            # Volver a marcarlas para reintentar en el siguiente flush
+            for collection, keys in pending.items():
+                if keys is None:
+                    self.save_data(collection)
+                else:
+                    self.mark_dirty(collection, *keys)
+            raise
 
     def update_daily_active_users(self):
-        """Actualiza el contador de usuarios activos diarios."""
-        current_time = time.time()
-        one_day_ago = current_time - 86400  # 24 horas en segundos
-        
-        # Contar usuarios activos en las últimas 24 horas
-        active_users = 0
-        for user_id, last_active in self.stats["user_last_active"].items():
-            if last_active > one_day_ago:
-                active_users += 1
-        
-        self.stats["daily_active_users"] = active_users
+        """Actualiza los contadores de usuarios activos en 24h, 7 días y 30 días.
+
+        No se llama en cada mensaje: lo hacen las vistas de estadísticas antes de
+        leerlos y el guardado periódico.
+        """
+        for key, window in (("daily_active_users", "24h"), ("weekly_active_users", "7d"), ("monthly_active_users", "30d")):
+            count = self.activity.count(window)
+            if self.stats.get(key) != count:
+                self.stats[key] = count
+                self.mark_dirty("stats", key)
 
     def update_user_activity(self, user_id):
-        """Actualiza la actividad del usuario y las estadísticas."""
+        """Registra la actividad del usuario: solo marca la hora, sin recalcular estadísticas."""
         current_time = time.time()
         
         # Registrar al usuario si es nuevo
         if user_id not in self.users:
-            self.users[user_id] = {
-                "role": "user",
-                "gender": None,
-                "joined_date": current_time,
-                "waiting_for_match": False,
-                "paired_with": None,
-                "first_seen": current_time,
-                "last_active": current_time
-            }
+            self.users[user_id] = UserRecord(
+                role="user",
+                joined_date=current_time,
+                waiting_for_match=False,
+                first_seen=current_time,
+                last_active=current_time
+            )
             self.stats["total_users"] += 1
+            self.mark_dirty("stats", "total_users")
+            self._count_gender(None, 1)
         else:
             self.users[user_id]["last_active"] = current_time
+        self.mark_dirty("users", user_id)
         
         # Actualizar última actividad
-        self.stats["user_last_active"][str(user_id)] = current_time
-        
-        # Actualizar usuarios activos diarios
-        self.update_daily_active_users()
-        
-        # Actualizar distribución por género
-        self.update_gender_stats()
-        
-        # Actualizar el pico de usuarios concurrentes
-        self.update_peak_users()
-        
-        # Guardar cambios
-        self.save_data()
+        self.activity.touch(user_id, current_time)
+        self.mark_dirty("stats", ("user_last_active", user_id))
 
     def update_peak_users(self):
-        """Actualiza el pico de usuarios concurrentes."""
+        """Actualiza el pico de usuarios concurrentes (solo cambia al entrar en espera o en un chat)."""
         # Calcular usuarios activos actualmente (en chat o esperando)
         active_users = len(self.active_chats) // 2  # Usuarios en chat
-        waiting_users = sum(len(users) for users in self.waiting_users.values())  # Usuarios esperando
-        if hasattr(self, 'gender_waiting_users'):
-            waiting_users += sum(len(users) for users in self.gender_waiting_users.values())  # Usuarios en nuevas listas
+        waiting_users = len(self.gender_waiting_users)  # Usuarios esperando
         
         current_active = active_users + waiting_users
         
@@ -156,26 +297,49 @@ class DataStore:
         if current_active > self.stats.get("peak_concurrent_users", 0):
             self.stats["peak_concurrent_users"] = current_active
             self.stats["peak_time"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+            self.mark_dirty("stats", "peak_concurrent_users", "peak_time")
             return True
         return False
     
+    def _count_gender(self, gender, delta):
+        """Ajusta el contador de un género en la distribución de usuarios."""
+        gender_stats = self.stats["gender_stats"]
+        key = gender if gender in ("male", "female", "non_binary") else "unknown"
+        gender_stats[key] = gender_stats.get(key, 0) + delta
+        self.mark_dirty("stats", "gender_stats")
+
+    def _count_active(self, user_id, delta):
+        """Ajusta el recuento por género de los usuarios en un chat.
+
+        Al salir se resta el género con el que se contó al entrar, aunque el
+        usuario haya cambiado de género o se haya eliminado mientras tanto.
+        """
+        if delta > 0:
+            gender = self.users[user_id].get("gender") if user_id in self.users else None
+            self._active_genders[user_id] = gender
+        else:
+            gender = self._active_genders.pop(user_id, None)
+        if gender in self.active_gender_counts:
+            self.active_gender_counts[gender] += delta
+
     def update_gender_stats(self):
-        """Actualiza las estadísticas de género basado en los usuarios actuales."""
+        """Recalcula desde cero la distribución por género.
+
+        Los contadores se mantienen de forma incremental; este recuento completo
+        solo se usa como comprobación de consistencia (p. ej. al cargar los datos).
+        """
         gender_stats = {"male": 0, "female": 0, "non_binary": 0, "unknown": 0}
         
         # Solo contar usuarios que están registrados actualmente
-        for user_id, user_data in self.users.items():
-            if isinstance(user_data, dict):
-                gender = user_data.get("gender")
-                if gender in gender_stats:
-                    gender_stats[gender] += 1
-                else:
-                    gender_stats["unknown"] += 1
+        for user_data in self.users.values():
+            gender = user_data.get("gender")
+            if gender in gender_stats:
+                gender_stats[gender] += 1
             else:
-                logger.warning(f"User data for {user_id} is not a dictionary: {type(user_data)}")
                 gender_stats["unknown"] += 1
         
         self.stats["gender_stats"] = gender_stats
+        self.mark_dirty("stats", "gender_stats")
 
     def set_user_gender(self, user_id, gender):
         """Establece el género del usuario."""
@@ -184,55 +348,96 @@ class DataStore:
             gender = "non_binary"
         
         if user_id in self.users:
-            # Si el usuario ya estaba esperando, quitarlo de la lista anterior
             old_gender = self.users[user_id].get("gender")
-            if old_gender in self.waiting_users and self.users[user_id].get("waiting_for_match", False):
-                if user_id in self.waiting_users[old_gender]:
-                    self.waiting_users[old_gender].remove(user_id)
             
-            # Actualizar género
+            # Actualizar género (también en el recuento de chats activos si está en uno)
+            in_chat = user_id in self.active_chats
+            if in_chat:
+                self._count_active(user_id, -1)
             self.users[user_id]["gender"] = gender
+            self._count_gender(old_gender, -1)
+            if in_chat:
+                self._count_active(user_id, 1)
+            
+            # Si el usuario ya estaba esperando, moverlo a la cola de su nuevo género
+            waiting_key = self.gender_waiting_users.key_of(user_id)
+            if waiting_key is not None:
+                self.gender_waiting_users.enqueue(user_id, gender, waiting_key[1])
+                self.save_data("sessions")
         else:
-            self.users[user_id] = {
-                "role": "user",
-                "gender": gender,
-                "joined_date": time.time(),
-                "waiting_for_match": False,
-                "paired_with": None
-            }
+            self.users[user_id] = UserRecord(
+                role="user",
+                gender=gender,
+                joined_date=time.time(),
+                waiting_for_match=False
+            )
             self.stats["total_users"] += 1
+            self.mark_dirty("stats", "total_users")
         
-        self.update_gender_stats()
-        self.save_data()
+        self._count_gender(gender, 1)
+        self.mark_dirty("users", user_id)
 
     def add_to_waiting(self, user_id, gender):
-        """Añade usuario a la lista de espera correspondiente."""
-        # Normalizar valor de género para la consistencia
-        if gender == "nonbinary":
-            gender = "non_binary"
-            
-        if user_id not in self.waiting_users[gender]:
-            self.waiting_users[gender].append(user_id)
-            self.users[user_id]["waiting_for_match"] = True
-            self.save_data()
-            return True
-        return False
+        """Añade usuario a la lista de espera del género que busca, si no estaba ya."""
+        key = self.gender_waiting_users.key_of(user_id)
+        if key is not None and key[1] == ("non_binary" if gender == "nonbinary" else gender):
+            return False
+        self.add_to_waiting_target(user_id, gender)
+        return True
 
     def remove_from_waiting(self, user_id):
         """Elimina usuario de cualquier lista de espera."""
-        for gender in self.waiting_users:
-            if user_id in self.waiting_users[gender]:
-                self.waiting_users[gender].remove(user_id)
-                if user_id in self.users:
-                    self.users[user_id]["waiting_for_match"] = False
-                self.save_data()
-                return True
-        return False
+        if not self.gender_waiting_users.remove(user_id):
+            return False
+        if user_id in self.users:
+            self.users[user_id]["waiting_for_match"] = False
+            self.mark_dirty("users", user_id)
+        self.save_data("sessions")
+        return True
+
+    def find_waiting_partner(self, user_id, wanted_gender):
+        """Saca de la espera a la primera pareja compatible, o devuelve None."""
+        own_gender = self.users[user_id].get("gender")
+        while True:
+            partner_id = self.gender_waiting_users.pop_partner(own_gender, wanted_gender)
+            if partner_id is not None:
+                self.save_data("sessions")
+            # Descartar entradas obsoletas (usuarios que ya están en un chat o baneados)
+            if partner_id is None or (partner_id != user_id and partner_id not in self.active_chats
+                                      and partner_id not in self.banned):
+                return partner_id
+
+    def match_waiting_users(self):
+        """Empareja de una vez a todos los usuarios compatibles en espera."""
+        pairs = []
+        popped = self.gender_waiting_users.pop_pairs()
+        if popped:
+            self.save_data("sessions")
+        requeued = []
+        for user_id1, user_id2, joined_at1, joined_at2 in popped:
+            if user_id1 in self.active_chats or user_id2 in self.active_chats:
+                continue
+            if user_id1 in self.banned or user_id2 in self.banned:
+                # ban_user ya los saca de la espera; si aun así aparece uno, su pareja vuelve a la cola
+                for user_id, partner_id, joined_at in ((user_id1, user_id2, joined_at1), (user_id2, user_id1, joined_at2)):
+                    if user_id not in self.banned and user_id in self.users:
+                        requeued.append((user_id, partner_id, joined_at))
+                continue
+            self.create_chat(user_id1, user_id2)
+            pairs.append((user_id1, user_id2))
+        # Vuelven al principio de su cola, en el orden en que salieron, sin perder su turno
+        for user_id, partner_id, joined_at in reversed(requeued):
+            self.gender_waiting_users.push_front(
+                user_id, self.users[user_id].get("gender"), self.users.get(partner_id, {}).get("gender"), joined_at
+            )
+        return pairs
 
     def create_chat(self, user_id1, user_id2):
         """Crea un chat entre dos usuarios."""
         self.active_chats[user_id1] = user_id2
         self.active_chats[user_id2] = user_id1
+        self.gender_waiting_users.remove(user_id1)
+        self.gender_waiting_users.remove(user_id2)
         
         if user_id1 in self.users:
             self.users[user_id1]["paired_with"] = user_id2
@@ -242,16 +447,17 @@ class DataStore:
             self.users[user_id2]["paired_with"] = user_id1
             self.users[user_id2]["waiting_for_match"] = False
         
+        self._count_active(user_id1, 1)
+        self._count_active(user_id2, 1)
         self.stats["active_sessions"] += 1
         self.stats["total_chats"] += 1
         
         # Actualizar pico de usuarios
-        current_sessions = len(self.active_chats) // 2
-        if current_sessions > self.stats["peak_concurrent_users"]:
-            self.stats["peak_concurrent_users"] = current_sessions
-            self.stats["peak_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.update_peak_users()
         
-        self.save_data()
+        self.mark_dirty("users", user_id1, user_id2)
+        self.mark_dirty("stats", "active_sessions", "total_chats")
+        self.save_data("sessions")
 
     def end_chat(self, user_id):
         """Finaliza un chat activo."""
@@ -268,9 +474,13 @@ class DataStore:
             # Eliminar del diccionario de chats activos
             del self.active_chats[user_id]
             del self.active_chats[partner_id]
+            self._count_active(user_id, -1)
+            self._count_active(partner_id, -1)
             
             self.stats["active_sessions"] -= 1
-            self.save_data()
+            self.mark_dirty("users", user_id, partner_id)
+            self.mark_dirty("stats", "active_sessions")
+            self.save_data("sessions")
             return partner_id
         
         return None
@@ -285,14 +495,31 @@ class DataStore:
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "status": "pending"  # pending, reviewed, dismissed
         }
-        self.reports.append(report)
-        self.save_data()
-        return len(self.reports) - 1  # Índice del reporte
+        report_id = self.reports.add(report)
+        self.mark_dirty("reports", report_id)
+        self._stats_changed()
+        return report_id
+
+    def set_report_status(self, report_id, status, admin_id):
+        """Marca un reporte como resuelto o descartado. Retorna el reporte, o None si no existe."""
+        report = self.reports.set_status(report_id, status)
+        if report is None:
+            return None
+        # resolved_by/resolved_at o dismissed_by/dismissed_at
+        report[f"{status}_by"] = admin_id
+        report[f"{status}_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.mark_dirty("reports", report_id)
+        self._stats_changed()
+        return report
 
     def is_admin(self, user_id):
         """Verifica si el usuario es admin."""
         return user_id in self.admins or user_id == self.super_admin_id
 
+    def is_banned(self, user_id):
+        """Verifica si un usuario está baneado."""
+        return user_id in self.banned
+
     def is_super_admin(self, user_id):
         """Verifica si el usuario es el superadministrador."""
         return user_id == self.super_admin_id
@@ -303,9 +530,10 @@ class DataStore:
             return False
         self.admins.add(user_id)
         if user_id not in self.users:
-            self.users[user_id] = {}
+            self.users[user_id] = UserRecord()
+            self._count_gender(None, 1)
         self.users[user_id]["role"] = "admin"
-        self.save_data()
+        self.mark_dirty("users", user_id)
         return True
 
     def remove_admin(self, user_id):
@@ -314,9 +542,8 @@ class DataStore:
             return False
         self.admins.remove(user_id)
         if user_id in self.users:
-            if "role" in self.users[user_id]:
-                self.users[user_id].pop("role", None)
-        self.save_data()
+            self.users[user_id].pop("role", None)
+            self.mark_dirty("users", user_id)
         return True
 
     def ban_user(self, user_id):
@@ -325,11 +552,18 @@ class DataStore:
         if user_id == self.super_admin_id:
             return False
         if user_id not in self.users:
-            self.users[user_id] = {}
+            self.users[user_id] = UserRecord()
+            self._count_gender(None, 1)
         if self.users[user_id].get("banned", False):
             return False
         self.users[user_id]["banned"] = True
-        self.save_data()
+        self.banned.add(user_id)
+        # Un usuario baneado no puede quedarse esperando pareja
+        if self.gender_waiting_users.remove(user_id):
+            self.users[user_id]["waiting_for_match"] = False
+            self.save_data("sessions")
+        self.mark_dirty("users", user_id)
+        self._stats_changed()
         return True
 
     def unban_user(self, user_id):
@@ -339,7 +573,9 @@ class DataStore:
         if not self.users[user_id].get("banned", False):
             return False
         self.users[user_id]["banned"] = False
-        self.save_data()
+        self.banned.discard(user_id)
+        self.mark_dirty("users", user_id)
+        self._stats_changed()
         return True
 
     def get_user_info_by_id(self, user_id, bot=None):
@@ -359,40 +595,25 @@ class DataStore:
         # Inicializar contadores
         counts = {"male": 0, "female": 0, "non_binary": 0}
         
-        # Contar usuarios en la lista de espera
-        for gender, users in self.waiting_users.items():
-            for user_id in users:
-                if user_id in self.users and self.users[user_id]["gender"] in counts:
-                    counts[self.users[user_id]["gender"]] += 1
+        # Las colas ya están indexadas por el género de quien espera
+        counts.update(self.gender_waiting_users.count_by_gender())
         
         return counts
 
     def get_active_counts(self):
         """Obtiene conteo de usuarios activos por género."""
-        gender_counts = {"male": 0, "female": 0, "non_binary": 0}
-        
-        # Contar usuarios únicos en chats activos
-        counted_users = set()
-        for user_id in self.active_chats.keys():
-            if user_id not in counted_users and user_id in self.users:
-                counted_users.add(user_id)
-                gender = self.users[user_id].get("gender")
-                if gender == "male" or gender == "female":
-                    gender_counts[gender] += 1
-                elif gender == "non_binary" or gender == "nonbinary":
-                    gender_counts["non_binary"] += 1
-                    # Actualizar para consistencia si se encuentra "nonbinary"
-                    if gender == "nonbinary":
-                        self.users[user_id]["gender"] = "non_binary"
-        
-        return gender_counts
+        return dict(self.active_gender_counts)
+
+    def get_report_counts(self):
+        """Devuelve el número de reportes por estado."""
+        return self.reports.counts()
 
     def update_message_stats(self, message_type):
         """Actualiza las estadísticas de mensajes."""
         self.stats["messages_sent"] += 1
-        if message_type in self.stats["content_types"]:
-            self.stats["content_types"][message_type] += 1
-        self.save_data()
+        content_types = self.stats["content_types"]
+        content_types[message_type if message_type in content_types else "other"] += 1
+        self.mark_dirty("stats", "messages_sent", "content_types")
 
     def get_user_info_by_id(self, user_id, bot=None):
         """Obtiene información detallada de un usuario por su ID."""
@@ -434,75 +655,18 @@ class DataStore:
                 user_info["bot_data"]["current_state"] = "in_chat"
                 user_info["bot_data"]["chatting_with"] = self.active_chats[user_id]
             else:
-                for gender, users in self.waiting_users.items():
-                    if user_id in users:
-                        user_info["bot_data"]["current_state"] = f"waiting_for_match_{gender}"
-                        break
+                waiting_key = self.gender_waiting_users.key_of(user_id)
+                if waiting_key is not None:
+                    user_info["bot_data"]["current_state"] = f"waiting_for_match_{waiting_key[1]}"
                 else:
                     user_info["bot_data"]["current_state"] = "idle"
             
             # Historial de reportes
-            reports_as_reporter = [r for r in self.reports if r["reporter_id"] == user_id]
-            reports_as_reported = [r for r in self.reports if r["reported_id"] == user_id]
-            
-            user_info["bot_data"]["reports_filed"] = len(reports_as_reporter)
-            user_info["bot_data"]["times_reported"] = len(reports_as_reported)
+            user_info["bot_data"]["reports_filed"] = len(self.reports.by_reporter(user_id))
+            user_info["bot_data"]["times_reported"] = len(self.reports.by_reported(user_id))
         
         return user_info
 
-    def check_spam(self, user_id):
-        """
-        Verifica si un usuario está enviando spam.
-        Retorna (está_en_cooldown, segundos_restantes)
-        """
-        current_time = time.time()
-        
-        # Si no hay registro de spam para este usuario, crearlo
-        if user_id not in self.spam_control:
-            self.spam_control[user_id] = {
-                "message_count": 1,
-                "first_message_time": current_time,
-                "cooldown_until": 0
-            }
-            return False, 0
-        
-        # Verificar si el usuario está en período de cooldown
-        if self.spam_control[user_id]["cooldown_until"] > current_time:
-            remaining = int(self.spam_control[user_id]["cooldown_until"] - current_time)
-            return True, remaining
-        
-        # Si pasaron más de 60 segundos desde el primer mensaje, reiniciar contador
-        time_window = 60  # ventana de 60 segundos
-        if current_time - self.spam_control[user_id]["first_message_time"] > time_window:
-            self.spam_control[user_id] = {
-                "message_count": 1,
-                "first_message_time": current_time,
-                "cooldown_until": 0
-            }
-            return False, 0
-        
-        # Incrementar contador de mensajes
-        self.spam_control[user_id]["message_count"] += 1
-        
-        # Si excede el límite, aplicar cooldown
-        message_limit = 15
-        if self.spam_control[user_id]["message_count"] > message_limit:
-            cooldown_time = 20  # 20 segundos de cooldown (cambiado de 30 a 20)
-            self.spam_control[user_id]["cooldown_until"] = current_time + cooldown_time
-            self.spam_control[user_id]["message_count"] = 0
-            return True, cooldown_time
-        
-        return False, 0
-
-    def reset_spam_counter(self, user_id):
-        """Reinicia el contador de spam para un usuario."""
-        if user_id in self.spam_control:
-            self.spam_control[user_id] = {
-                "message_count": 0,
-                "first_message_time": time.time(),
-                "cooldown_until": 0
-            }
-
 
 # Funciones auxiliares
 def format_time_difference(seconds):
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+
+GENDERS = ("male", "female", "non_binary")
+
+
+class MatchQueues:
+    """Colas de espera para emparejar, indexadas por (género propio, género buscado).
+
+    Cada cola es un OrderedDict en orden de llegada y un índice inverso guarda
+    en qué cola está cada usuario, de modo que encolar, cancelar y sacar a la
+    primera pareja compatible cuesta O(1).
+    """
+
+    def __init__(self):
+        self._queues = {}  # {(género propio, género buscado): OrderedDict{user_id: hora de entrada}}
+        self._index = {}  # {user_id: (género propio, género buscado)}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, user_id):
+        return user_id in self._index
+
+    def key_of(self, user_id):
+        """Devuelve (género propio, género buscado) del usuario o None si no espera."""
+        return self._index.get(user_id)
+
+    def enqueue(self, user_id, own_gender, wanted_gender, joined_at=None):
+        """Pone al usuario al final de la cola correspondiente."""
+        self.remove(user_id)
+        key = (own_gender, wanted_gender)
+        self._queues.setdefault(key, OrderedDict())[user_id] = time.time() if joined_at is None else joined_at
+        self._index[user_id] = key
+
+    def push_front(self, user_id, own_gender, wanted_gender, joined_at):
+        """Devuelve al usuario al principio de su cola conservando su hora de entrada."""
+        self.enqueue(user_id, own_gender, wanted_gender, joined_at)
+        self._queues[(own_gender, wanted_gender)].move_to_end(user_id, last=False)
+
+    def remove(self, user_id):
+        """Saca al usuario de la cola en la que esté. Devuelve True si estaba."""
+        key = self._index.pop(user_id, None)
+        if key is None:
+            return False
+        queue = self._queues[key]
+        del queue[user_id]
+        if not queue:
+            del self._queues[key]
+        return True
+
+    def pop_partner(self, own_gender, wanted_gender):
+        """Saca al primer usuario que busca `own_gender` y es de `wanted_gender`."""
+        queue = self._queues.get((wanted_gender, own_gender))
+        if not queue:
+            return None
+        partner_id, _ = queue.popitem(last=False)
+        del self._index[partner_id]
+        if not queue:
+            del self._queues[(wanted_gender, own_gender)]
+        return partner_id
+
+    def entries(self):
+        """Devuelve [[user_id, género propio, género buscado, hora de entrada]] en orden de llegada."""
+        entries = [
+            [user_id, own_gender, wanted_gender, joined_at]
+            for (own_gender, wanted_gender), queue in self._queues.items()
+            for user_id, joined_at in queue.items()
+        ]
+        entries.sort(key=lambda entry: entry[3])
+        return entries
+
+    def count_by_gender(self):
+        """Devuelve cuántos usuarios esperan, agrupados por su propio género."""
+        counts = dict.fromkeys(GENDERS, 0)
+        for (own_gender, _), queue in self._queues.items():
+            if own_gender in counts:
+                counts[own_gender] += len(queue)
+        return counts
+
+    def pop_pairs(self):
+        """Saca de las colas todas las parejas compatibles.
+
+        Devuelve [(user_id, partner_id, hora de entrada, hora de entrada de la pareja)].
+        """
+        pairs = []
+        for own_gender, wanted_gender in list(self._queues):
+            key, partner_key = (own_gender, wanted_gender), (wanted_gender, own_gender)
+            queue, partner_queue = self._queues.get(key), self._queues.get(partner_key)
+            if not queue or not partner_queue:
+                continue
+            # Si ambos buscan su propio género, la cola se empareja consigo misma
+            while len(queue) >= (2 if key == partner_key else 1) and partner_queue:
+                user_id, joined_at = queue.popitem(last=False)
+                partner_id, partner_joined_at = partner_queue.popitem(last=False)
+                del self._index[user_id]
+                del self._index[partner_id]
+                pairs.append((user_id, partner_id, joined_at, partner_joined_at))
+            for empty_key in (key, partner_key):
+                if empty_key in self._queues and not self._queues[empty_key]:
+                    del self._queues[empty_key]
+        return pairs
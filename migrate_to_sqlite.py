@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Importa los archivos data/*.json existentes a la base de datos SQLite.
+
+Uso:
+    python migrate_to_sqlite.py [--data-dir data] [--db data/bot.sqlite3]
+"""
+
+import argparse
+import logging
+
+from storage import COLLECTION_FILES, DATA_DIR, JsonStorage, SqliteStorage
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def migrate(data_dir, db_path=None):
+    """Copia usuarios, estadísticas y reportes de los JSON a SQLite."""
+    loaded = JsonStorage(data_dir).load()
+    if not loaded:
+        logger.warning(f"No se encontraron archivos JSON en {data_dir}")
+        return
+
+    sqlite_storage = SqliteStorage(data_dir, db_path)
+    collections = {name: loaded.get(name, [] if name == "reports" else {}) for name in COLLECTION_FILES}
+    dirty = {name: None for name in loaded}
+    sqlite_storage.commit(sqlite_storage.prepare(collections, dirty))
+    sqlite_storage.close()
+
+    logger.info(
+        f"Migración completada en {sqlite_storage.db_path}: "
+        f"{len(collections['users'])} usuarios, {len(collections['reports'])} reportes"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra los datos JSON del bot a SQLite.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directorio con users.json, stats.json y reports.json")
+    parser.add_argument("--db", default=None, help="Ruta de la base de datos (por defecto <data-dir>/bot.sqlite3)")
+    args = parser.parse_args()
+    migrate(args.data_dir, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Valores por defecto para los envíos masivos
+FAN_OUT_CONCURRENCY = 10  # Envíos simultáneos como máximo
+FAN_OUT_TIMEOUT = 15  # Segundos por intento y destinatario
+FAN_OUT_RETRIES = 2  # Reintentos tras el primer intento fallido
+
+# Carriles de prioridad para los envíos (menor = más urgente)
+PRIORITY_RELAY = 0  # Mensajes reenviados entre usuarios en un chat
+PRIORITY_MENU = 1  # Menús, respuestas a botones y comandos
+PRIORITY_BACKGROUND = 2  # Avisos a administradores, borrados y difusiones
+
+# Límites de la API de Telegram para chats privados
+GLOBAL_RATE = 30  # Mensajes por segundo en total
+CHAT_RATE = 1  # Mensajes por segundo y chat
+CHAT_BURST = 3  # Ráfaga permitida por chat
+
+
+async def _deliver(send, chat_id, timeout, retries):
+    """Envía a un destinatario con timeout y reintentos. Devuelve None o la excepción final."""
+    error = None
+    for attempt in range(retries + 1):
+        try:
+            await asyncio.wait_for(send(chat_id), timeout)
+            return None
+        except (Forbidden, BadRequest) as e:
+            # Bot bloqueado, chat inexistente...: reintentar no sirve de nada
+            return e
+        except RetryAfter as e:
+            error = e
+            delay = e.retry_after
+        except Exception as e:
+            error = e
+            delay = 2 ** attempt
+        if attempt < retries:
+            await asyncio.sleep(delay)
+    return error
+
+
+async def fan_out(send, recipients, concurrency=FAN_OUT_CONCURRENCY, timeout=FAN_OUT_TIMEOUT, retries=FAN_OUT_RETRIES):
+    """Envía un mismo aviso a varios destinatarios en paralelo.
+
+    `send` es una función async que recibe el chat_id y hace el envío. Como mucho
+    `concurrency` envíos están en curso a la vez. Devuelve {chat_id: None si se
+    entregó, o la excepción del último intento}.
+    """
+    recipients = list(recipients)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(chat_id):
+        async with semaphore:
+            return await _deliver(send, chat_id, timeout, retries)
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in recipients))
+    delivery = dict(zip(recipients, results))
+    for chat_id, error in delivery.items():
+        if error is not None:
+            logger.error(f"No se pudo entregar el aviso a {chat_id}: {error}")
+    return delivery
+
+
+class TokenBucket:
+    """Cubeta de tokens con reservas: el saldo puede quedar en negativo y
+    cada reserva devuelve cuánto hay que esperar para usar su token."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """Reserva un token y devuelve los segundos de espera hasta poder usarlo."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_idle(self, now):
+        """Indica si la cubeta está llena y por tanto puede descartarse."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Planificador de envíos a la API de Telegram.
+
+    Cada petición que crea mensajes en un chat pasa primero por la cubeta de ese
+    chat y después todas compiten por la cubeta global, que se reparte por orden
+    de prioridad (ver PRIORITY_*). Se indica con `rate_limit_args=PRIORITY_...`
+    en las llamadas a context.bot; sin ella se usa PRIORITY_MENU. Ante un
+    RetryAfter se pausan todos los envíos y se reintenta la petición.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, max_retries=3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}  # {chat_id: TokenBucket}
+        self._waiting = []  # heap de (prioridad, orden de llegada, future)
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._dispatcher = None
+        self._evict_at = 1024  # Tamaño de self._chats que dispara la limpieza
+
+    async def initialize(self):
+        """El despachador se arranca con la primera petición."""
+
+    async def shutdown(self):
+        """Detiene el despachador."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def _dispatch(self):
+        """Entrega los tokens globales a las peticiones en espera, por prioridad."""
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            delay = self._global.reserve(now)
+            if delay:
+                await asyncio.sleep(delay)
+            # La prioridad se decide al liberar el token, no al reservarlo
+            while self._waiting:
+                _, _, future = heapq.heappop(self._waiting)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+    async def _acquire(self, chat_id, priority):
+        if chat_id is not None:
+            now = time.monotonic()
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= self._evict_at:
+                    self._evict_idle(now)
+                    self._evict_at = max(1024, 2 * len(self._chats))
+                bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = bucket.reserve(now)
+            if delay:
+                await asyncio.sleep(delay)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    def _evict_idle(self, now):
+        """Descarta las cubetas de chats que ya se han rellenado por completo."""
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.is_idle(now)]:
+            del self._chats[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = PRIORITY_MENU if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+        # Solo los envíos que crean mensajes cuentan para el límite por chat
+        if not (isinstance(chat_id, int) and endpoint.startswith(("send", "copy", "forward"))):
+            chat_id = None
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Límite de Telegram alcanzado en {endpoint}, reintentando en {e.retry_after}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
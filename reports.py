@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+REPORT_STATUSES = ("pending", "resolved", "dismissed")
+
+
+class ReportStore:
+    """Reportes con IDs estables e índices por estado, denunciante y denunciado.
+
+    El ID de un reporte es su posición en la lista persistida, que solo crece,
+    así que nunca cambia ni se reutiliza. Los índices se construyen al cargar y
+    se mantienen en add() y set_status(): obtener el siguiente pendiente o los
+    reportes de un usuario no recorre la lista.
+    """
+
+    def __init__(self, reports=None):
+        self._reports = []  # [reporte o None], el índice es el ID
+        self._by_status = {}  # {estado: OrderedDict{report_id: None}} en orden de llegada
+        self._by_reporter = {}  # {user_id: [report_ids]}
+        self._by_reported = {}  # {user_id: [report_ids]}
+        for report in reports or []:
+            if isinstance(report, dict):
+                self.add(report)
+            else:
+                # Hueco de un reporte eliminado: se conserva para no mover los IDs
+                self._reports.append(None)
+
+    def __len__(self):
+        return len(self._reports)
+
+    def __getitem__(self, report_id):
+        return self._reports[report_id]
+
+    def __iter__(self):
+        return (report for report in self._reports if report is not None)
+
+    def to_list(self):
+        """Devuelve el formato persistido: la lista de reportes por ID."""
+        return self._reports
+
+    def get(self, report_id):
+        """Devuelve el reporte o None si no existe."""
+        if isinstance(report_id, int) and 0 <= report_id < len(self._reports):
+            return self._reports[report_id]
+        return None
+
+    def add(self, report):
+        """Guarda un reporte nuevo y devuelve su ID."""
+        report_id = len(self._reports)
+        self._reports.append(report)
+        status = report.setdefault("status", "pending")
+        self._by_status.setdefault(status, OrderedDict())[report_id] = None
+        self._by_reporter.setdefault(report.get("reporter_id"), []).append(report_id)
+        self._by_reported.setdefault(report.get("reported_id"), []).append(report_id)
+        return report_id
+
+    def set_status(self, report_id, status):
+        """Cambia el estado de un reporte. Retorna el reporte, o None si no existe."""
+        report = self.get(report_id)
+        if report is None:
+            return None
+        previous = report["status"]
+        if previous != status:
+            ids = self._by_status[previous]
+            del ids[report_id]
+            if not ids:
+                del self._by_status[previous]
+            self._by_status.setdefault(status, OrderedDict())[report_id] = None
+            report["status"] = status
+        return report
+
+    def next_pending(self):
+        """Devuelve (report_id, reporte) del pendiente más antiguo, o None si no hay."""
+        pending = self._by_status.get("pending")
+        if not pending:
+            return None
+        report_id = next(iter(pending))
+        return report_id, self._reports[report_id]
+
+    def counts(self):
+        """Devuelve el número de reportes por estado."""
+        counts = dict.fromkeys(REPORT_STATUSES, 0)
+        for status, ids in self._by_status.items():
+            counts[status] = len(ids)
+        return counts
+
+    def by_reporter(self, user_id):
+        """IDs de los reportes enviados por el usuario, en orden."""
+        return self._by_reporter.get(user_id, [])
+
+    def by_reported(self, user_id):
+        """IDs de los reportes recibidos por el usuario, en orden."""
+        return self._by_reported.get(user_id, [])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from ttlmap import TTLMap
+
+# Valores por defecto del limitador
+SPAM_RATE = 15  # Mensajes por minuto sostenidos
+SPAM_BURST = 15  # Mensajes seguidos permitidos antes de limitar
+SPAM_COOLDOWN = 20  # Segundos de bloqueo al superar el límite
+
+# Coste de cada tipo de contenido en tokens (los que no aparecen cuestan 1)
+CONTENT_COSTS = {
+    "sticker": 2,
+    "animation": 2,
+    "dice": 3,
+    "poll": 3
+}
+
+
+class SpamBucket:
+    """Estado del limitador para un usuario."""
+
+    __slots__ = ("tokens", "updated", "cooldown_until", "warned")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.cooldown_until = 0.0
+        self.warned = False
+
+
+class SpamLimiter:
+    """Limitador de mensajes por usuario con cubetas de tokens.
+
+    Cada usuario tiene una cubeta de `burst` tokens que se rellena a `rate`
+    tokens por minuto; cada mensaje gasta el coste de su tipo de contenido.
+    Quien se queda sin tokens entra en un cooldown de `cooldown` segundos.
+    El estado vive solo en memoria: una cubeta sin uso durante el tiempo que
+    tarda en rellenarse y terminar su cooldown se descarta.
+    """
+
+    def __init__(self, rate=SPAM_RATE, burst=SPAM_BURST, cooldown=SPAM_COOLDOWN, costs=CONTENT_COSTS):
+        self.rate = rate / 60  # Tokens por segundo
+        self.burst = burst
+        self.cooldown = cooldown
+        self.costs = costs
+        self._buckets = TTLMap(ttl=burst / self.rate + cooldown)  # {user_id: SpamBucket}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def check(self, user_id, content_type="text", now=None):
+        """Registra un mensaje. Retorna (está_en_cooldown, segundos_restantes)."""
+        now = time.time() if now is None else now
+        bucket = self._buckets.get(user_id, now=now)
+        if bucket is None:
+            bucket = SpamBucket(self.burst, now)
+            self._buckets.set(user_id, bucket, now=now)
+
+        if bucket.cooldown_until > now:
+            return True, int(bucket.cooldown_until - now) + 1
+
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        cost = self.costs.get(content_type, 1)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return False, 0
+
+        bucket.cooldown_until = now + self.cooldown
+        bucket.warned = False
+        return True, self.cooldown
+
+    def take_warning(self, user_id):
+        """Devuelve True solo la primera vez que se consulta en cada cooldown."""
+        bucket = self._buckets.get(user_id)
+        if bucket is None or bucket.warned:
+            return False
+        bucket.warned = True
+        return True
+
+    def reset(self, user_id):
+        """Olvida el estado de un usuario (cubeta llena y sin cooldown)."""
+        self._buckets.pop(user_id, None)
+
+    def evict_idle(self, now=None):
+        """Descarta las cubetas inactivas. Devuelve cuántas se eliminaron."""
+        return self._buckets.evict_expired(now)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+STATS_CACHE_TTL = 10  # Segundos que se reutiliza un mensaje de estadísticas ya generado
+
+
+class StatsService:
+    """Instantánea de las estadísticas y caché de los mensajes generados con ella.
+
+    Los contadores (sesiones, espera y chats por género, reportes por estado) los
+    mantiene DataStore al modificar los datos, así que tomar la instantánea no
+    recorre ninguna colección. Cada vista se genera como mucho una vez cada
+    `ttl` segundos: la caducidad es absoluta y no se renueva al leer. Un reporte
+    nuevo o resuelto y un baneo o desbaneo vacían la caché al momento.
+    """
+
+    def __init__(self, data_store, ttl=STATS_CACHE_TTL):
+        self.data_store = data_store
+        self.ttl = ttl
+        self._rendered = {}  # {vista: (hora de caducidad, texto)}
+        data_store.on_stats_change(self.invalidate)
+
+    def snapshot(self):
+        """Devuelve los contadores actuales."""
+        db = self.data_store
+        db.update_daily_active_users()
+        sessions = len(db.active_chats) // 2
+        return {
+            "sessions": sessions,
+            "online": sessions + len(db.gender_waiting_users),
+            "waiting": db.get_waiting_counts(),
+            "active": db.get_active_counts(),
+            "reports": db.get_report_counts(),
+            "stats": db.stats
+        }
+
+    def render(self, view, build, now=None):
+        """Devuelve el texto de la vista, generándolo con `build(snapshot)` si no está en caché."""
+        now = time.monotonic() if now is None else now
+        cached = self._rendered.get(view)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        text = build(self.snapshot())
+        self._rendered[view] = (now + self.ttl, text)
+        return text
+
+    def invalidate(self, view=None):
+        """Descarta una vista de la caché, o todas."""
+        if view is None:
+            self._rendered.clear()
+        else:
+            self._rendered.pop(view, None)
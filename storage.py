@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Rutas de archivos para persistencia
+DATA_DIR = "data"
+
+# Colecciones persistidas y el archivo JSON de cada una
+COLLECTION_FILES = {
+    "users": "users.json",
+    "stats": "stats.json",
+    "reports": "reports.json",
+    "sessions": "sessions.json"
+}
+
+# Marca usada en el journal para indicar que una clave fue eliminada
+_DELETED = object()
+
+
+def _to_json(value):
+    """Convierte a JSON los registros propios mediante su to_dict() (UserRecord) o to_list() (ReportStore)."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if hasattr(value, "to_list"):
+        return value.to_list()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(data):
+    """Serializa a JSON compacto."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_to_json)
+
+
+def _atomic_write(path, payload):
+    """Escribe el contenido en un archivo temporal y lo renombra sobre el destino."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _lookup(data, path):
+    """Devuelve el valor en la ruta indicada o _DELETED si no existe."""
+    for part in path:
+        try:
+            data = data[part]
+        except (KeyError, IndexError, TypeError):
+            return _DELETED
+    return data
+
+
+def _apply(data, path, value):
+    """Aplica un valor (o una eliminación) en la ruta indicada."""
+    for part in path[:-1]:
+        if isinstance(data, list):
+            data = data[int(part)]
+        else:
+            data = data.setdefault(part, {})
+    last = path[-1]
+    if isinstance(data, list):
+        last = int(last)
+        if value is _DELETED:
+            if last < len(data):
+                data[last] = None
+            return
+        while len(data) <= last:
+            data.append(None)
+        data[last] = value
+    elif value is _DELETED:
+        data.pop(last, None)
+    else:
+        data[last] = value
+
+
+class JsonStorage:
+    """Guarda cada colección completa en su propio archivo JSON."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+
+    def _path(self, collection):
+        return os.path.join(self.data_dir, COLLECTION_FILES[collection])
+
+    def load(self):
+        """Carga las colecciones existentes. Devuelve {colección: datos}."""
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        loaded = {}
+        for collection in COLLECTION_FILES:
+            path = self._path(collection)
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    loaded[collection] = json.load(f)
+        return loaded
+
+    def prepare(self, collections, dirty):
+        """Serializa los cambios pendientes. Se ejecuta en el event loop."""
+        return [(self._path(collection), _dumps(collections[collection])) for collection in dirty]
+
+    def commit(self, batch):
+        """Escribe a disco un lote preparado. Puede ejecutarse en otro hilo."""
+        for path, payload in batch:
+            _atomic_write(path, payload)
+
+    def close(self):
+        """No mantiene recursos abiertos."""
+
+
+class JournalStorage:
+    """Journal de solo-añadir más un snapshot periódico.
+
+    Cada cambio se añade como un registro compacto al journal; cuando éste supera
+    `compact_every` registros, se vuelca un snapshot completo y se vacía el journal.
+    Al arrancar se carga el snapshot y se reaplica el journal encima. La
+    compactación parte de los archivos (snapshot + journal) y no de los datos en
+    memoria, así se hace entera en commit(), fuera del event loop.
+    """
+
+    SNAPSHOT_FILE = "snapshot.json"
+    JOURNAL_FILE = "journal.jsonl"
+
+    def __init__(self, data_dir=DATA_DIR, compact_every=10000):
+        self.data_dir = data_dir
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(data_dir, self.SNAPSHOT_FILE)
+        self.journal_path = os.path.join(data_dir, self.JOURNAL_FILE)
+        self._records = 0  # Registros en el journal desde el último snapshot
+        self._lock = threading.Lock()  # commit() puede ejecutarse en otro hilo
+
+    def load(self):
+        """Carga el snapshot y reaplica el journal. Devuelve {colección: datos}."""
+        with self._lock:
+            loaded, records, imported = self._read()
+        # Tras importar los JSON antiguos, el primer commit ya genera el snapshot
+        self._records = self.compact_every if imported else records
+        return loaded
+
+    def _read(self):
+        """Lee el snapshot y reaplica el journal. Devuelve (datos, registros del journal, si se importaron JSON)."""
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        imported = False
+        records = 0
+        if os.path.isfile(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        else:
+            # Primera ejecución con este backend: importar los JSON antiguos
+            loaded = JsonStorage(self.data_dir).load()
+            if loaded:
+                logger.info("Importando archivos JSON existentes al journal")
+                imported = True
+
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "rb+") as f:
+                complete_end = 0  # Posición tras la última línea terminada en salto de línea
+                for line_number, line in enumerate(f, 1):
+                    torn = not line.endswith(b"\n")
+                    try:
+                        record = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        logger.warning(f"Registro de journal inválido en la línea {line_number}, ignorado")
+                        record = None
+                    if torn:
+                        # Última línea cortada por un apagado brusco: se recorta del archivo para
+                        # que el siguiente commit no escriba a continuación de ella
+                        f.seek(complete_end)
+                        f.truncate()
+                        if record is not None:
+                            # Solo faltaba el salto de línea: el registro está completo
+                            f.write(line + b"\n")
+                    else:
+                        complete_end += len(line)
+                    if record is not None:
+                        self._replay(loaded, record)
+                        records += 1
+
+        return loaded, records, imported
+
+    def _replay(self, loaded, record):
+        """Aplica un registro del journal sobre los datos cargados."""
+        collection = record["c"]
+        value = _DELETED if record.get("d") else record.get("v")
+        if "k" not in record:
+            loaded[collection] = value
+            return
+        if collection not in loaded:
+            loaded[collection] = [] if collection == "reports" else {}
+        _apply(loaded[collection], record["k"], value)
+
+    def prepare(self, collections, dirty):
+        """Genera los registros del journal y decide si toca compactar."""
+        lines = []
+        for collection, keys in dirty.items():
+            data = collections[collection]
+            if keys is None:
+                lines.append(_dumps({"c": collection, "v": data}))
+                continue
+            for key in keys:
+                path = key if isinstance(key, tuple) else (key,)
+                value = _lookup(data, path)
+                # Las claves se guardan como texto, igual que en un objeto JSON
+                record = {"c": collection, "k": [str(part) for part in path]}
+                if value is _DELETED:
+                    record["d"] = 1
+                else:
+                    record["v"] = value
+                lines.append(_dumps(record))
+
+        self._records += len(lines)
+        compact = self._records >= self.compact_every
+        if compact:
+            self._records = 0
+        return lines, compact
+
+    def commit(self, batch):
+        """Añade los registros al journal y, si corresponde, compacta. Puede ejecutarse en otro hilo."""
+        lines, compact = batch
+        with self._lock:
+            if lines:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            if compact:
+                loaded, _, _ = self._read()
+                _atomic_write(self.snapshot_path, _dumps(loaded))
+                # El snapshot ya contiene todo lo del journal
+                open(self.journal_path, "w", encoding="utf-8").close()
+
+    def close(self):
+        """No mantiene recursos abiertos."""
+
+
+class SqliteStorage:
+    """Base de datos SQLite en modo WAL con una tabla por colección.
+
+    Es un backend de durabilidad, no de consulta: cada usuario, reporte y
+    última actividad es una fila (ID + registro en JSON), así cada cambio se
+    escribe sin reescribir archivos enteros. El resto de estadísticas y el
+    estado de las sesiones se guardan como pares clave/valor. Como con los
+    demás backends, todo se carga en memoria al arrancar y las consultas del
+    bot se resuelven ahí, por lo que no hay columnas, índices ni tablas
+    derivadas que mantener en cada escritura.
+    """
+
+    DB_FILE = "bot.sqlite3"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS activity (
+            user_id TEXT PRIMARY KEY,
+            last_active REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stats (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        -- Restos de versiones anteriores que nadie lee y solo encarecían las escrituras
+        -- (las columnas sobrantes de users y reports admiten NULL o tienen valor por defecto)
+        DROP TABLE IF EXISTS admins;
+        DROP TABLE IF EXISTS bans;
+        DROP INDEX IF EXISTS idx_reports_reported_id;
+        DROP INDEX IF EXISTS idx_reports_reporter_id;
+        DROP INDEX IF EXISTS idx_reports_status;
+        DROP INDEX IF EXISTS idx_activity_last_active;
+    """
+
+    def __init__(self, data_dir=DATA_DIR, db_path=None):
+        self.data_dir = data_dir
+        self.db_path = db_path or os.path.join(data_dir, self.DB_FILE)
+        self._conn = None
+        self._lock = threading.Lock()  # commit() puede ejecutarse en otro hilo
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def load(self):
+        """Carga las colecciones desde la base de datos. Devuelve {colección: datos}."""
+        with self._lock:
+            conn = self._connect()
+            users = {user_id: json.loads(data) for user_id, data in conn.execute("SELECT user_id, data FROM users")}
+            stats = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM stats")}
+            reports = [json.loads(data) for (data,) in conn.execute("SELECT data FROM reports ORDER BY id")]
+            activity = dict(conn.execute("SELECT user_id, last_active FROM activity"))
+            sessions = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM sessions")}
+
+        loaded = {}
+        if users:
+            loaded["users"] = users
+        if stats:
+            stats["user_last_active"] = activity
+            loaded["stats"] = stats
+        if reports:
+            loaded["reports"] = reports
+        if sessions:
+            loaded["sessions"] = sessions
+        return loaded
+
+    def prepare(self, collections, dirty):
+        """Traduce los cambios pendientes a sentencias SQL con sus valores."""
+        statements = []
+        for collection, keys in dirty.items():
+            data = collections[collection]
+            if collection == "users":
+                if keys is None:
+                    statements += [("DELETE FROM users", ())]
+                    keys = list(data)
+                for user_id in keys:
+                    statements += self._user_statements(str(user_id), _lookup(data, (user_id,)))
+            elif collection == "reports":
+                if keys is None:
+                    statements.append(("DELETE FROM reports", ()))
+                    keys = range(len(data))
+                for report_id in keys:
+                    statements += self._report_statements(int(report_id), _lookup(data, (report_id,)))
+            elif collection == "stats":
+                if keys is None:
+                    statements += [("DELETE FROM stats", ()), ("DELETE FROM activity", ())]
+                    keys = [key for key in data if key != "user_last_active"]
+                    keys += [("user_last_active", user_id) for user_id in data.get("user_last_active", {})]
+                for key in keys:
+                    path = key if isinstance(key, tuple) else (key,)
+                    statements += self._stat_statements(path, _lookup(data, path))
+            elif collection == "sessions":
+                if keys is None:
+                    statements.append(("DELETE FROM sessions", ()))
+                    keys = list(data)
+                for key in keys:
+                    value = _lookup(data, (key,))
+                    if value is _DELETED:
+                        statements.append(("DELETE FROM sessions WHERE key = ?", (str(key),)))
+                    else:
+                        statements.append(("INSERT OR REPLACE INTO sessions (key, value) VALUES (?, ?)", (str(key), _dumps(value))))
+        return statements
+
+    def _user_statements(self, user_id, user):
+        if user is _DELETED or not hasattr(user, "get"):
+            return [("DELETE FROM users WHERE user_id = ?", (user_id,))]
+        return [(
+            "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+            (user_id, _dumps(user))
+        )]
+
+    def _report_statements(self, report_id, report):
+        if report is _DELETED or not isinstance(report, dict):
+            return [("DELETE FROM reports WHERE id = ?", (report_id,))]
+        return [(
+            "INSERT OR REPLACE INTO reports (id, data) VALUES (?, ?)",
+            (report_id, _dumps(report))
+        )]
+
+    def _stat_statements(self, path, value):
+        if path[0] == "user_last_active":
+            if len(path) == 1:
+                # Todo el mapa de actividad cambió
+                statements = [("DELETE FROM activity", ())]
+                for user_id, last_active in (value if isinstance(value, dict) else {}).items():
+                    statements += self._stat_statements(("user_last_active", user_id), last_active)
+                return statements
+            user_id = str(path[1])
+            if value is _DELETED:
+                return [("DELETE FROM activity WHERE user_id = ?", (user_id,))]
+            return [("INSERT OR REPLACE INTO activity (user_id, last_active) VALUES (?, ?)", (user_id, value))]
+        key = str(path[0])
+        if value is _DELETED:
+            return [("DELETE FROM stats WHERE key = ?", (key,))]
+        return [("INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)", (key, _dumps(value)))]
+
+    def commit(self, batch):
+        """Ejecuta las sentencias preparadas en una única transacción."""
+        if not batch:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for sql, params in batch:
+                    conn.execute(sql, params)
+
+    def close(self):
+        """Cierra la conexión con la base de datos."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "sqlite": SqliteStorage
+}
+
+
+def create_storage(kind="json", data_dir=DATA_DIR):
+    """Crea el backend de almacenamiento indicado por nombre."""
+    if kind not in STORAGE_BACKENDS:
+        raise ValueError(f"Backend de almacenamiento desconocido: {kind}")
+    return STORAGE_BACKENDS[kind](data_dir)
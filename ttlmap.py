@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+
+
+class TTLMap:
+    """Diccionario que olvida las claves sin uso durante `ttl` segundos.
+
+    Las claves se mantienen en orden de último acceso, así que las caducadas
+    siempre están al principio y se eliminan sin recorrer el resto. Con
+    `maxsize` se descartan además las menos usadas (LRU) al superar el límite.
+    La limpieza se hace al insertar y con evict_expired().
+    """
+
+    def __init__(self, ttl, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # {clave: valor}, del acceso más antiguo al más reciente
+        self._touched = {}  # {clave: hora del último acceso}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        touched = self._touched.get(key)
+        return touched is not None and touched + self.ttl > time.time()
+
+    def get(self, key, default=None, now=None):
+        """Devuelve el valor y lo marca como usado, o `default` si no existe o caducó."""
+        touched = self._touched.get(key)
+        if touched is None:
+            return default
+        now = time.time() if now is None else now
+        if touched + self.ttl <= now:
+            self.pop(key)
+            return default
+        self._touched[key] = now
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key, value, now=None):
+        """Guarda el valor como usado ahora y aplica la caducidad y el tamaño máximo."""
+        now = time.time() if now is None else now
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._touched[key] = now
+        self.evict_expired(now)
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                del self._data[oldest]
+                del self._touched[oldest]
+
+    def pop(self, key, default=None):
+        """Elimina la clave y devuelve su valor (aunque hubiera caducado)."""
+        self._touched.pop(key, None)
+        return self._data.pop(key, default)
+
+    def evict_expired(self, now=None):
+        """Elimina las claves caducadas. Devuelve cuántas se eliminaron."""
+        now = time.time() if now is None else now
+        evicted = 0
+        for key in self._data:
+            if self._touched[key] + self.ttl > now:
+                break
+            evicted += 1
+        for _ in range(evicted):
+            oldest = next(iter(self._data))
+            del self._data[oldest]
+            del self._touched[oldest]
+        return evicted
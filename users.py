@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from enum import IntEnum
+
+
+class Gender(IntEnum):
+    MALE = 1
+    FEMALE = 2
+    NON_BINARY = 3
+
+
+class Role(IntEnum):
+    USER = 0
+    ADMIN = 1
+
+
+# Nombres usados en el formato persistido y en el resto del bot
+GENDER_NAMES = {Gender.MALE: "male", Gender.FEMALE: "female", Gender.NON_BINARY: "non_binary"}
+GENDER_BY_NAME = {name: gender for gender, name in GENDER_NAMES.items()}
+GENDER_BY_NAME["nonbinary"] = Gender.NON_BINARY
+ROLE_NAMES = {Role.USER: "user", Role.ADMIN: "admin"}
+ROLE_BY_NAME = {name: role for role, name in ROLE_NAMES.items()}
+
+# Campos persistidos de un usuario, en el orden en que se serializan
+USER_FIELDS = (
+    "role", "gender", "joined_date", "waiting_for_match", "paired_with",
+    "first_seen", "last_active", "banned"
+)
+
+_MISSING = object()
+
+
+class UserRecord:
+    """Registro compacto de un usuario.
+
+    Género y rol se guardan como enteros pequeños (Gender, Role) y el resto de
+    campos en slots, en lugar de un dict por usuario. Para no cambiar a los
+    llamadores se mantiene el acceso tipo dict con los nombres de texto de
+    siempre: record["gender"] == "male", record.get("banned", False)... Un campo
+    a None se considera ausente. Las claves desconocidas se conservan en `extra`.
+    """
+
+    __slots__ = USER_FIELDS + ("extra",)
+
+    def __init__(self, **fields):
+        for field in USER_FIELDS:
+            setattr(self, field, None)
+        self.extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Construye el registro a partir del formato persistido."""
+        return cls(**data)
+
+    def to_dict(self):
+        """Devuelve el formato persistido (solo los campos presentes)."""
+        data = {key: self[key] for key in USER_FIELDS if getattr(self, key) is not None}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # Compatibilidad con el acceso tipo dict
+
+    def __getitem__(self, key):
+        # Los campos conocidos siempre existen (a None si no tienen valor)
+        value = self.get(key, None if key in USER_FIELDS else _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key == "gender":
+            value = self.gender
+            value = GENDER_NAMES.get(value, value)
+        elif key == "role":
+            value = self.role
+            value = ROLE_NAMES.get(value, value)
+        elif key in USER_FIELDS:
+            value = getattr(self, key)
+        else:
+            value = self.extra.get(key) if self.extra else None
+        return default if value is None else value
+
+    def __setitem__(self, key, value):
+        if key == "gender":
+            # Los valores desconocidos se guardan tal cual para no perder datos
+            value = GENDER_BY_NAME.get(value, value)
+        elif key == "role":
+            value = ROLE_BY_NAME.get(value, value)
+        elif key not in USER_FIELDS:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self[key] = None
+        if self.extra and key in self.extra:
+            del self.extra[key]
+        return value
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def copy(self):
+        return self.to_dict()
+
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"